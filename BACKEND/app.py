@@ -1,51 +1,179 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
-import pandas as pd
-import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
 import os
 import time
 import json
-from services.data_processor import DataProcessor
-from services.recommendation_system import RecommendationSystem
+import re
+import uuid
+from services.catalog import CatalogRegistry, UnknownCatalogError
+from services.ingest import IngestJobs
+from services.feedback_store import open_feedback_store
+from services.feedback_aggregates import FeedbackAggregates
+from services.song_serializer import SONG_FIELDS, round_scores
+from services.collaborative import CollaborativeTrainer
+from services.data_processor import profile_values
+from services.result_cache import ResultCache
+from services.metrics import metrics, PIPELINE_STAGES
+from services.session_log import SessionLog
+from services.sharded_scoring import ShardedScorer, SHARD_ROWS, SHARDED_MIN_ROWS
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
 CORS(app)
 
+# Per-endpoint latency; labelled by route pattern so song ids in the URL do
+# not create a series each
+REQUEST_LATENCY = metrics.histogram('http_request_seconds', 'Request latency per endpoint',
+                                    ('endpoint', 'method', 'status'))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.labels(endpoint, request.method, str(response.status_code)).observe(
+            time.perf_counter() - started)
+    return response
+
 # Initialize services
+# Optional multi-core scoring for large catalogs: SCORING_WORKERS > 0 splits
+# candidate sets of SCORING_MIN_ROWS or more into SCORING_SHARD_ROWS shards
+# scored on a thread pool (SCORING_EXECUTOR=process for forked workers over
+# shared memory). Created first so process workers fork before any
+# background thread exists.
+SCORING_WORKERS = int(os.environ.get('SCORING_WORKERS', 0))
+scorer = None
+if SCORING_WORKERS > 0:
+    scorer = ShardedScorer(workers=SCORING_WORKERS,
+                           shard_rows=int(os.environ.get('SCORING_SHARD_ROWS', SHARD_ROWS)),
+                           min_rows=int(os.environ.get('SCORING_MIN_ROWS', SHARDED_MIN_ROWS)),
+                           executor=os.environ.get('SCORING_EXECUTOR', 'thread'))
 DATA_PATH = os.path.join(os.path.dirname(__file__), 'DATA', 'mainSong.csv')
 FEEDBACK_PATH = os.path.join('DATA', 'feedback.json')
-data_processor = DataProcessor(DATA_PATH)
-recommender = RecommendationSystem(data_processor, feedback_path=FEEDBACK_PATH)
+# Feedback is kept in an append-only store; the legacy JSON array above is
+# migrated into it once, the first time the store is created.
+FEEDBACK_BACKEND = os.environ.get('FEEDBACK_BACKEND', 'jsonl')
+FEEDBACK_STORE_PATH = os.path.join('DATA', 'feedback.db' if FEEDBACK_BACKEND == 'sqlite' else 'feedback.jsonl')
+# FEEDBACK_FSYNC=1 syncs each group commit to disk before feedback is acknowledged
+FEEDBACK_FSYNC = bool(int(os.environ.get('FEEDBACK_FSYNC', 0)))
+feedback_store = open_feedback_store(FEEDBACK_STORE_PATH, backend=FEEDBACK_BACKEND, legacy_path=FEEDBACK_PATH,
+                                     fsync=FEEDBACK_FSYNC)
+feedback_aggregates = FeedbackAggregates.from_store(feedback_store)
+# Collaborative model trained in the background; resumes from its checkpoint
+CF_CHECKPOINT_PATH = os.path.join('DATA', 'cf_checkpoint.npz')
+# Song ids are bounded by the largest catalog loaded, so one bad id cannot
+# blow up the item factors
+collaborative = CollaborativeTrainer(feedback_store, checkpoint_path=CF_CHECKPOINT_PATH,
+                                     max_items=lambda: catalogs.max_rows or None)
+# /api/recommend results, keyed on the scaled preference vector plus the
+# catalog and collaborative model versions; RECOMMEND_CACHE_SIZE=0 disables it
+RECOMMEND_CACHE_SIZE = int(os.environ.get('RECOMMEND_CACHE_SIZE', 4096))
+RECOMMEND_CACHE_TTL = float(os.environ.get('RECOMMEND_CACHE_TTL', 600))
+recommend_cache = ResultCache(max_entries=RECOMMEND_CACHE_SIZE, ttl=RECOMMEND_CACHE_TTL or None)
+metrics.register_gauges('recommend_cache', 'Recommendation result cache counters', recommend_cache.stats)
+metrics.register_gauges('feedback', 'Feedback totals', feedback_aggregates.stats)
+# Catalogs by name: 'default' (mainSong.csv), 'user' (the last upload) and
+# tenant catalogs under DATA/catalogs/<name>.csv. Each lives in immutable
+# snapshots with its own indexes; handlers pin one per request with
+# current_catalog() and reloads swap a new one in from a background thread.
+# Idle catalogs are evicted, least recently used first, once the resident
+# ones exceed CATALOG_MEMORY_BUDGET_MB (0 keeps every catalog resident).
+CATALOG_DIR = os.path.join(os.path.dirname(__file__), 'DATA', 'catalogs')
+CATALOG_NAME_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+CATALOG_MEMORY_BUDGET_MB = float(os.environ.get('CATALOG_MEMORY_BUDGET_MB', 2048))
+# Uploaded CSVs are compiled chunk by chunk in the background
+ingest_jobs = IngestJobs()
 
 USER_SESSIONS_PATH = os.path.join('DATA', 'user_sessions.json')
+# Sessions go to a rotating, segmented append-only log; the legacy JSON array
+# is migrated into it once, the first time the log is created
+SESSION_LOG_DIR = os.path.join('DATA', 'sessions')
+SESSION_SEGMENT_BYTES = int(os.environ.get('SESSION_SEGMENT_BYTES', 4 * 1024 * 1024))
+SESSION_MAX_SEGMENTS = int(os.environ.get('SESSION_MAX_SEGMENTS', 16))
+SESSION_RETENTION_DAYS = float(os.environ.get('SESSION_RETENTION_DAYS', 0))
+session_log = SessionLog(SESSION_LOG_DIR, segment_bytes=SESSION_SEGMENT_BYTES, max_segments=SESSION_MAX_SEGMENTS,
+                         max_age=SESSION_RETENTION_DAYS * 86400 or None, legacy_path=USER_SESSIONS_PATH)
 CSV_TYPE_PATH = os.path.join(os.path.dirname(__file__), 'DATA', 'csv_type.json')
 
 # Helper to set/get current CSV type
 DEFAULT_CSV_PATH = os.path.join(os.path.dirname(__file__), 'DATA', 'mainSong.csv')
 USER_CSV_PATH = os.path.join(os.path.dirname(__file__), 'DATA', 'user_uploaded.csv')
 
+def catalog_path(name):
+    if name == 'default':
+        return DEFAULT_CSV_PATH
+    if name == 'user':
+        return USER_CSV_PATH
+    if isinstance(name, str) and CATALOG_NAME_RE.match(name):
+        return os.path.join(CATALOG_DIR, name + '.csv')
+    return None
+
+catalogs = CatalogRegistry(catalog_path, collaborative=collaborative, result_cache=recommend_cache,
+                           memory_budget=CATALOG_MEMORY_BUDGET_MB * 1024 * 1024 or None, scorer=scorer)
+metrics.register_gauges('catalogs', 'Resident catalogs', lambda: {
+    'resident': len(catalogs.resident()), 'memory_bytes': catalogs.memory_usage()})
+
+def load_csv_type():
+    try:
+        with open(CSV_TYPE_PATH, 'r') as f:
+            return json.load(f).get('type', 'default')
+    except (OSError, ValueError):
+        return 'default'
+
+# The selection is read from csv_type.json once and kept in memory; the file
+# only persists it across restarts
+csv_type_state = {'type': load_csv_type()}
+
 def set_csv_type(csv_type):
-    with open(CSV_TYPE_PATH, 'w') as f:
+    csv_type_state['type'] = csv_type
+    # Written to a temp file and renamed over, so a crash never leaves it
+    # empty
+    tmp_path = f'{CSV_TYPE_PATH}.{uuid.uuid4().hex[:8]}.tmp'
+    with open(tmp_path, 'w') as f:
         json.dump({'type': csv_type}, f)
+    os.replace(tmp_path, CSV_TYPE_PATH)
 def get_csv_type():
-    if os.path.exists(CSV_TYPE_PATH):
-        with open(CSV_TYPE_PATH, 'r') as f:
-            return json.load(f).get('type', 'default')
-    return 'default'
+    return csv_type_state['type']
 
-def reload_data_processor():
-    global data_processor, recommender
+def selected_catalog():
+    # Catalog used by requests that don't name one, as chosen with use-csv
     csv_type = get_csv_type()
-    path = USER_CSV_PATH if csv_type == 'user' and os.path.exists(USER_CSV_PATH) else DEFAULT_CSV_PATH
-    data_processor = DataProcessor(path)
-    recommender = RecommendationSystem(data_processor, feedback_path=FEEDBACK_PATH)
+    path = catalog_path(csv_type)
+    return csv_type if path and os.path.exists(path) else 'default'
+
+def requested_catalog():
+    # ?catalog=<name>, or "catalog" in a JSON object body
+    name = request.args.get('catalog')
+    if name is None and request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            name = data.get('catalog')
+    return name or selected_catalog()
+
+def current_catalog():
+    return catalogs.get(requested_catalog())
+
+def select_catalog(name):
+    # Loads the catalog in the background and only then makes it the
+    # selected one, so requests keep using the previous catalog instead of
+    # building this one on their own thread. The latest selection wins even
+    # if an earlier one finishes loading after it.
+    csv_type_state['pending'] = name
+    def ready():
+        if csv_type_state.get('pending') == name:
+            set_csv_type(name)
+    catalogs.load_async(name, on_ready=ready)
+
+@app.errorhandler(UnknownCatalogError)
+def unknown_catalog(e):
+    return jsonify({'error': 'Unknown catalog', 'catalog': e.args[0]}), 404
 
 # Save user session (called after recommendation or feedback)
 def save_user_session(preferences, recommended_songs=None, feedback=None):
-    import time
     session = {
         'timestamp': int(time.time()),
         'preferences': preferences,
@@ -53,29 +181,21 @@ def save_user_session(preferences, recommended_songs=None, feedback=None):
         'feedback': feedback or []
     }
     try:
-        if os.path.exists(USER_SESSIONS_PATH):
-            with open(USER_SESSIONS_PATH, 'r') as f:
-                sessions = json.load(f)
-        else:
-            sessions = []
-        sessions.append(session)
-        with open(USER_SESSIONS_PATH, 'w') as f:
-            json.dump(sessions, f, indent=2)
+        # Queued for the background writer; does not wait for the disk
+        session_log.append(session)
     except Exception as e:
         print('Error saving user session:', e)
 
 def save_feedback(feedback_entry):
     try:
-        if os.path.exists(FEEDBACK_PATH):
-            with open(FEEDBACK_PATH, 'r') as f:
-                feedback_data = json.load(f)
-        else:
-            feedback_data = []
-        feedback_data.append(feedback_entry)
-        with open(FEEDBACK_PATH, 'w') as f:
-            json.dump(feedback_data, f, indent=2)
+        # Waits for the group commit that carries this entry, which raises
+        # if that commit failed
+        feedback_store.append(feedback_entry)
     except Exception as e:
         print('Error saving feedback:', e)
+        return False
+    feedback_aggregates.record(feedback_entry)
+    return True
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'DATA')
 ALLOWED_EXTENSIONS = {'csv'}
@@ -85,7 +205,6 @@ def allowed_file(filename):
 
 @app.route('/api/upload-csv', methods=['POST'])
 def upload_csv():
-    global data_processor, recommender
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
@@ -93,185 +212,288 @@ def upload_csv():
         return jsonify({'error': 'No selected file'}), 400
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        file_path = USER_CSV_PATH
-        file.save(file_path)
-        
-        # Set CSV type to user
-        set_csv_type('user')
-        
-        # Reload DataProcessor with new CSV
-        try:
-            reload_data_processor()
-            return jsonify({'status': 'success'})
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+        # ?catalog=<name> uploads a tenant catalog; by default the upload
+        # replaces the 'user' catalog and becomes the selected one
+        name = request.args.get('catalog') or request.form.get('catalog') or 'user'
+        target_path = catalog_path(name)
+        if target_path is None or name == 'default':
+            return jsonify({'error': 'Invalid catalog name'}), 400
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # Streamed to a private file; the ingest job compiles it in chunks
+        # and only then moves it over the catalog's CSV
+        tmp_path = f'{target_path}.{uuid.uuid4().hex[:8]}.upload'
+        file.save(tmp_path)
+
+        def activate():
+            # Load the compiled catalog; a user upload also becomes the
+            # selected CSV once it is loaded
+            if name == 'user':
+                select_catalog('user')
+            else:
+                catalogs.load_async(name)
+        job_id = ingest_jobs.submit(tmp_path, target_path, on_done=activate)
+        return jsonify({'status': 'success', 'job_id': job_id, 'catalog': name}), 202
     return jsonify({'error': 'Invalid file type'}), 400
 
+@app.route('/api/ingest/<job_id>', methods=['GET'])
+def ingest_status(job_id):
+    job = ingest_jobs.job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
 @app.route('/api/download-demo-csv', methods=['GET'])
 def download_demo_csv():
     demo_path = os.path.join(UPLOAD_FOLDER, 'mainSong.csv')
     return send_file(demo_path, as_attachment=True)
 
+MAX_PAGE_SIZE = 1000
+DEFAULT_PAGE_SIZE = 100
+
 @app.route('/api/songs', methods=['GET'])
 def get_songs():
-    df = data_processor.get_raw_df()
-    return jsonify([recommender.song_to_dict(row, idx) for idx, row in df.iterrows()])
+    # Without paging parameters the full catalog is returned as a plain list,
+    # as before. ?limit/?offset or ?cursor return one page with next_cursor;
+    # ?fields=title,artist projects; ?format=ndjson streams one song per line.
+    pages = current_catalog().data_processor.get_song_pages()
+    requested = [f for f in request.args.get('fields', '').split(',') if f]
+    unknown = [f for f in requested if f not in SONG_FIELDS]
+    if unknown:
+        return jsonify({'error': 'Unknown fields: ' + ', '.join(unknown)}), 400
+    # In SONG_FIELDS order without repeats, so equivalent projections share
+    # one cached page
+    fields = [f for f in SONG_FIELDS if f in requested] or SONG_FIELDS
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = request.args.get('limit')
+        limit = None if limit is None else int(limit)
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    cursor = request.args.get('cursor')
+    if cursor:
+        version, _, position = cursor.partition(':')
+        if version != pages.version or not position.isdigit():
+            return jsonify({'error': 'Cursor is stale or invalid; restart pagination'}), 409
+        offset = int(position)
+    paged = cursor is not None or limit is not None or 'offset' in request.args
+    if paged:
+        limit = min(max(limit if limit is not None else DEFAULT_PAGE_SIZE, 0), MAX_PAGE_SIZE)
+    offset = max(offset, 0)
+
+    if request.args.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', ''):
+        return Response(pages.ndjson_chunks(offset, limit, fields), mimetype='application/x-ndjson')
+
+    body, etag = pages.page(offset, limit, fields, wrap=paged)
+    if request.if_none_match.contains(etag.strip('"')):
+        return Response(status=304, headers={'ETag': etag})
+    return Response(body, mimetype='application/json', headers={'ETag': etag})
 
 @app.route('/api/recommend', methods=['POST'])
 def recommend():
-    user = request.json
-    results = recommender.recommend(user, top_n=10)
-    save_user_session(user, [r['id'] for r in results])
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    user = {k: v for k, v in data.items() if k != 'catalog'}
+    if profile_values(user) is None:
+        return jsonify({'error': 'Preference values must be numeric'}), 400
+    results = current_catalog().recommender.recommend(user, top_n=10)
+    with PIPELINE_STAGES.labels('recommend', 'save_user_session').time():
+        save_user_session(user, [r['id'] for r in results])
     return jsonify(results)
 
+MAX_BATCH_USERS = 1000
+MAX_BATCH_TOP_N = 100
+
+@app.route('/api/recommend/batch', methods=['POST'])
+def recommend_batch():
+    data = request.get_json(silent=True) or {}
+    users = data.get('users') if isinstance(data, dict) else data
+    if not isinstance(users, list) or not all(isinstance(u, dict) for u in users):
+        return jsonify({'error': 'Expected a list of preference objects in "users"'}), 400
+    if len(users) > MAX_BATCH_USERS:
+        return jsonify({'error': f'At most {MAX_BATCH_USERS} users per batch'}), 400
+    # One malformed user would otherwise fail the whole batch mid-scoring
+    invalid = [i for i, user in enumerate(users) if profile_values(user) is None]
+    if invalid:
+        return jsonify({'error': 'Preference values must be numeric', 'invalid_users': invalid}), 400
+    try:
+        top_n = int(data.get('top_n', 10)) if isinstance(data, dict) else 10
+    except (TypeError, ValueError):
+        return jsonify({'error': 'top_n must be an integer'}), 400
+    top_n = min(max(top_n, 0), MAX_BATCH_TOP_N)
+    rec = current_catalog().recommender
+    stream = request.args.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', '')
+    if stream:
+        # One JSON line per user, emitted as soon as its block is scored
+        def generate():
+            for i, results in enumerate(rec.iter_recommend_many(users, top_n)):
+                yield json.dumps({'index': i, 'results': results}) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson')
+    return jsonify({'results': rec.recommend_many(users, top_n)})
+
 @app.route('/api/feedback', methods=['POST'])
 def feedback():
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    # The preferences become a pseudo-user of the collaborative model, so
+    # they must turn into a feature vector
+    user_preferences = data.get('user_preferences') or {}
+    if profile_values(user_preferences) is None:
+        return jsonify({'error': 'user_preferences must be an object with numeric preference values'}), 400
+    # Song ids are catalog rows; anything else would grow the per-song
+    # counters and the collaborative model without bound
+    try:
+        song_id = int(data.get('song_id'))
+    except (TypeError, ValueError):
+        song_id = -1
+    if not 0 <= song_id < len(current_catalog().data_processor.get_song_serializer()):
+        return jsonify({'error': 'Unknown song_id'}), 400
     feedback_entry = {
         'song_id': data.get('song_id'),
         'feedback': data.get('feedback'),  # 'like' or 'dislike'
         'timestamp': int(time.time()),
-        'user_preferences': data.get('user_preferences', {})
+        'user_preferences': user_preferences
     }
-    save_feedback(feedback_entry)
-    save_user_session(data.get('user_preferences', {}), feedback=[feedback_entry])
+    clock = PIPELINE_STAGES.clock('feedback')
+    if not save_feedback(feedback_entry):
+        return jsonify({'error': 'Could not save feedback'}), 500
+    clock.lap('save_feedback')
+    save_user_session(user_preferences, feedback=[feedback_entry])
+    clock.lap('save_user_session')
     return jsonify({'status': 'success'})
 
 @app.route('/api/retrain', methods=['POST'])
 def retrain():
-    recommender.retrain()
-    return jsonify({'status': 'retraining complete'})
+    job_id = current_catalog().recommender.retrain()
+    return jsonify({'status': 'queued', 'job_id': job_id}), 202
+
+@app.route('/api/retrain/<job_id>', methods=['GET'])
+def retrain_status(job_id):
+    job = collaborative.job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
 
 @app.route('/api/admin/feedback-stats', methods=['GET'])
 def feedback_stats():
-    if os.path.exists(FEEDBACK_PATH):
-        with open(FEEDBACK_PATH, 'r') as f:
-            feedback_data = json.load(f)
-        like_count = sum(1 for entry in feedback_data if entry['feedback'] == 'like')
-        dislike_count = sum(1 for entry in feedback_data if entry['feedback'] == 'dislike')
-        return jsonify({'likes': like_count, 'dislikes': dislike_count, 'total': len(feedback_data)})
-    else:
-        return jsonify({'likes': 0, 'dislikes': 0, 'total': 0})
+    return jsonify(feedback_aggregates.stats())
 
 @app.route('/api/admin/song-popularity', methods=['GET'])
 def song_popularity():
-    if os.path.exists(FEEDBACK_PATH):
-        with open(FEEDBACK_PATH, 'r') as f:
-            feedback_data = json.load(f)
-        song_likes = {}
-        for entry in feedback_data:
-            if entry['feedback'] == 'like':
-                sid = entry['song_id']
-                song_likes[sid] = song_likes.get(sid, 0) + 1
-        # Return top 10 most liked songs
-        top_songs = sorted(song_likes.items(), key=lambda x: x[1], reverse=True)[:10]
-        return jsonify({'top_songs': top_songs})
-    else:
-        return jsonify({'top_songs': []})
+    # Return top 10 most liked songs
+    top_songs = feedback_aggregates.top_liked(10)
+    return jsonify({'top_songs': top_songs})
+
+@app.route('/api/admin/recommend-cache', methods=['GET'])
+def recommend_cache_stats():
+    return jsonify(recommend_cache.stats())
+
+@app.route('/api/admin/metrics', methods=['GET'])
+def admin_metrics():
+    # JSON for the dashboard; ?format=prometheus (or a text/plain Accept
+    # header) for a Prometheus scrape
+    accept = request.headers.get('Accept', '')
+    if request.args.get('format') == 'prometheus' or ('text/plain' in accept and 'json' not in accept):
+        return Response(metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+    return jsonify(metrics.to_json())
 
 @app.route('/api/admin/user-sessions', methods=['GET'])
 def user_sessions():
-    if os.path.exists(USER_SESSIONS_PATH):
-        with open(USER_SESSIONS_PATH, 'r') as f:
-            sessions = json.load(f)
-        # Return last 20 sessions
-        return jsonify({'sessions': sessions[-20:]})
-    else:
-        return jsonify({'sessions': []})
+    # Return last 20 sessions, from the in-memory ring
+    return jsonify({'sessions': session_log.recent(20)})
 
 @app.route('/api/trending-songs', methods=['GET'])
 def trending_songs():
-    if os.path.exists(FEEDBACK_PATH):
-        with open(FEEDBACK_PATH, 'r') as f:
-            feedback_data = json.load(f)
-        song_likes = {}
-        for entry in feedback_data:
-            if entry['feedback'] == 'like':
-                sid = entry['song_id']
-                song_likes[sid] = song_likes.get(sid, 0) + 1
-        top_songs = sorted(song_likes.items(), key=lambda x: x[1], reverse=True)[:10]
-        df = data_processor.get_raw_df()
-        details = []
-        for sid, count in top_songs:
-            try:
-                row = df.iloc[int(sid)]
-                details.append({
-                    'id': str(row.name),
-                    'title': row['title'],
-                    'artist': row['artist'],
-                    'genre': row['genre'],
-                    'year': int(row['year']),
-                    'bpm': int(row['bpm']),
-                    'energy': int(row['energy']),
-                    'danceability': int(row['danceability']),
-                    'duration': str(int(row['duration']//60)) + ':' + str(int(row['duration']%60)).zfill(2),
-                    'likes': count
-                })
-            except Exception:
-                continue
-        return jsonify({'trending': details})
-    else:
-        return jsonify({'trending': []})
+    serializer = current_catalog().data_processor.get_song_serializer()
+    top_songs = [(int(sid), count) for sid, count in feedback_aggregates.top_liked(10) if int(sid) < len(serializer)]
+    details = serializer.records([sid for sid, _ in top_songs], extra={'likes': [count for _, count in top_songs]})
+    return jsonify({'trending': details})
 
 @app.route('/api/similar-songs/<song_id>', methods=['GET'])
 def similar_songs(song_id):
     try:
-        df = data_processor.get_raw_df()
+        data_processor = current_catalog().data_processor
+        serializer = data_processor.get_song_serializer()
         idx = int(song_id)
-        if idx < 0 or idx >= len(df):
+        if idx < 0 or idx >= len(serializer):
             return jsonify({'similar': []})
-        row = df.iloc[idx]
-        # Use feature columns for similarity
-        features = data_processor.feature_cols
-        song_vec = df.loc[idx, features].values.reshape(1, -1)
-        df_features = df[features].values
-        sim = cosine_similarity(song_vec, df_features)[0]
-        # Exclude the song itself
-        sim[idx] = -1
-        top_idx = np.argsort(sim)[::-1][:10]
-        results = []
-        for i in top_idx:
-            r = df.iloc[i]
-            results.append({
-                'id': str(r.name),
-                'title': r['title'],
-                'artist': r['artist'],
-                'genre': r['genre'],
-                'year': int(r['year']),
-                'bpm': int(r['bpm']),
-                'energy': int(r['energy']),
-                'danceability': int(r['danceability']),
-                'duration': str(int(r['duration']//60)) + ':' + str(int(r['duration']%60)).zfill(2),
-                'score': float(f'{sim[i]:.3f}')
-            })
+        # Precomputed neighbors over the scaled features
+        top_idx, top_scores = data_processor.get_neighbor_table().neighbors(idx, 10)
+        results = serializer.records(top_idx, extra={'score': round_scores(top_scores)})
         return jsonify({'similar': results})
     except Exception as e:
         return jsonify({'similar': [], 'error': str(e)})
 
+# Facet fields and the csv-meta key each is listed under
+FACET_FIELDS = {'genre': 'genres', 'artist': 'artists', 'mood': 'moods'}
+CSV_META_LIMIT = 500
+MAX_CSV_META_LIMIT = 5000
+AUTOCOMPLETE_LIMIT = 10
+MAX_AUTOCOMPLETE_LIMIT = 100
+
 @app.route('/api/csv-meta', methods=['GET'])
 def csv_meta():
-    df = data_processor.get_raw_df()
-    genres = sorted(df['genre'].dropna().unique().tolist()) if 'genre' in df else []
-    artists = sorted(df['artist'].dropna().unique().tolist()) if 'artist' in df else []
-    moods = sorted(df['mood'].dropna().unique().tolist()) if 'mood' in df else []
-    return jsonify({'genres': genres, 'artists': artists, 'moods': moods})
+    # Served from the facet index built at load time. Each list holds the
+    # CSV_META_LIMIT most frequent values (?limit= to change) in alphabetical
+    # order; counts has them by frequency and distinct says how many exist,
+    # the rest being reachable through /api/autocomplete.
+    facets = current_catalog().data_processor.get_facet_index()
+    try:
+        limit = min(max(int(request.args.get('limit', CSV_META_LIMIT)), 0), MAX_CSV_META_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    meta = {'counts': {}, 'distinct': {}}
+    for field, key in FACET_FIELDS.items():
+        top = facets.top(field, limit)
+        meta[key] = sorted(value for value, _ in top)
+        meta['counts'][field] = top
+        meta['distinct'][field] = facets.distinct(field)
+    return jsonify(meta)
+
+@app.route('/api/autocomplete', methods=['GET'])
+def autocomplete():
+    # ?field=genre|artist|mood&q=<prefix>: values starting with q
+    # (case-insensitive), most frequent first
+    field = request.args.get('field', 'artist')
+    if field not in FACET_FIELDS:
+        return jsonify({'error': 'field must be one of: ' + ', '.join(FACET_FIELDS)}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', AUTOCOMPLETE_LIMIT)), 0), MAX_AUTOCOMPLETE_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    q = request.args.get('q', '')
+    matches = current_catalog().data_processor.get_facet_index().complete(field, q, limit)
+    return jsonify({'field': field, 'q': q, 'matches': [{'value': v, 'count': c} for v, c in matches]})
 
 @app.route('/api/use-csv', methods=['POST'])
 def use_csv():
+    # Selects the catalog used by requests that don't name one. A catalog
+    # that is already resident is not rebuilt; any other is loaded in the
+    # background and selected when ready.
     data = request.json
     csv_type = data.get('type', 'default')
-    if csv_type not in ['default', 'user']:
+    path = catalog_path(csv_type)
+    if path is None or not os.path.exists(path):
         return jsonify({'error': 'Invalid type'}), 400
-    set_csv_type(csv_type)
-    reload_data_processor()
-    return jsonify({'status': 'success', 'type': csv_type})
+    select_catalog(csv_type)
+    return jsonify({'status': 'success', 'type': csv_type, 'loading': catalogs.status(csv_type)['state'] == 'loading'})
 
 @app.route('/api/current-csv', methods=['GET'])
 def current_csv():
     return jsonify({'type': get_csv_type()})
 
-# On startup, ensure correct CSV is loaded
-reload_data_processor()
+@app.route('/api/catalog-status', methods=['GET'])
+def catalog_status():
+    return jsonify(catalogs.status(requested_catalog()))
+
+@app.route('/api/catalogs', methods=['GET'])
+def list_catalogs():
+    return jsonify(catalogs.stats())
+
+# On startup, load the selected CSV once before serving
+catalogs.load(selected_catalog())
+collaborative.submit()
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
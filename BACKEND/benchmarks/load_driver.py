@@ -0,0 +1,94 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+import numpy as np
+from services.append_log import write_jsonl_atomic
+from benchmarks.synthetic import generate_feedback, generate_preferences
+from benchmarks.timing import peak_rss_mb, summarize
+
+# Share of requests per endpoint
+DEFAULT_MIX = {'recommend': 0.5, 'similar_songs': 0.2, 'get_songs': 0.2, 'trending': 0.1}
+
+
+def _start_app(workdir, csv_path, n_songs, feedback_entries, seed):
+    # Imports the Flask app with workdir as the current directory, so its
+    # feedback store, sessions file and checkpoints live there, then swaps
+    # the synthetic catalog in. Must run in a fresh process.
+    data_dir = os.path.join(workdir, 'DATA')
+    os.makedirs(data_dir, exist_ok=True)
+    write_jsonl_atomic(os.path.join(data_dir, 'feedback.jsonl'),
+                       generate_feedback(feedback_entries, n_songs, seed=seed))
+    os.chdir(workdir)
+    import app as server
+    # Paths are looked up on each load; requests that name no catalog get
+    # 'default', persisted in the workdir rather than the repo
+    server.DEFAULT_CSV_PATH = csv_path
+    server.CSV_TYPE_PATH = os.path.join(data_dir, 'csv_type.json')
+    server.set_csv_type('default')
+    server.catalogs.load('default')
+    server.catalogs.get('default').data_processor.get_neighbor_table().wait(600)
+    # Let the startup retrain finish so it does not compete with the run
+    for job_id in list(server.collaborative.jobs):
+        while server.collaborative.job(job_id)['status'] in ('queued', 'running'):
+            time.sleep(0.05)
+    return server
+
+
+def run_load(csv_path, n_songs, workdir, seed=0, duration=10.0, concurrency=4, mix=None,
+             feedback_entries=20_000, preference_pool=200):
+    mix = mix or DEFAULT_MIX
+    # The server prints its own errors; keep stdout clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        server = _start_app(workdir, csv_path, n_songs, feedback_entries, seed)
+        genres = sorted(server.catalogs.get('default').data_processor.get_raw_df()['genre'].unique().tolist())
+        prefs = generate_preferences(preference_pool, seed=seed, genres=genres)
+        endpoints = list(mix)
+        weights = np.array([mix[e] for e in endpoints], dtype=np.float64)
+        weights /= weights.sum()
+        samples = {e: [] for e in endpoints}
+        errors = {e: 0 for e in endpoints}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker(worker_id):
+            client = server.app.test_client()
+            rng = np.random.default_rng(seed + worker_id)
+            local = {e: [] for e in endpoints}
+            local_errors = {e: 0 for e in endpoints}
+            while time.perf_counter() < deadline:
+                endpoint = endpoints[rng.choice(len(endpoints), p=weights)]
+                t0 = time.perf_counter()
+                if endpoint == 'recommend':
+                    response = client.post('/api/recommend', json=prefs[rng.integers(len(prefs))])
+                elif endpoint == 'similar_songs':
+                    response = client.get(f'/api/similar-songs/{rng.integers(n_songs)}')
+                elif endpoint == 'get_songs':
+                    response = client.get(f'/api/songs?limit=100&offset={rng.integers(n_songs)}')
+                else:
+                    response = client.get('/api/trending-songs')
+                response.get_data()
+                local[endpoint].append(time.perf_counter() - t0)
+                if response.status_code >= 400:
+                    local_errors[endpoint] += 1
+            with lock:
+                for e in endpoints:
+                    samples[e].extend(local[e])
+                    errors[e] += local_errors[e]
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+
+    results = {'duration_s': wall, 'concurrency': concurrency, 'mix': mix, 'endpoints': {}}
+    for e in endpoints:
+        results['endpoints'][e] = dict(summarize(samples[e], wall), errors=errors[e])
+    results['overall'] = summarize([s for e in endpoints for s in samples[e]], wall)
+    results['recommend_cache'] = server.recommend_cache.stats()
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
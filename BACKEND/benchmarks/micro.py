@@ -0,0 +1,106 @@
+import os
+import time
+import numpy as np
+from services.append_log import write_jsonl_atomic
+from services.collaborative import CollaborativeTrainer
+from services.data_processor import DataProcessor
+from services.feedback_store import open_feedback_store
+from services.recommendation_system import RecommendationSystem
+from services.result_cache import ResultCache
+from services.sharded_scoring import ShardedScorer
+from services.song_serializer import SONG_FIELDS, round_scores
+from benchmarks.synthetic import generate_feedback, generate_preferences, write_catalog_csv
+from benchmarks.timing import measure, peak_rss_mb
+
+# Longest we wait for the background neighbor table before timing lookups
+NEIGHBOR_TABLE_TIMEOUT = 600
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def train_collaborative(workdir, n_entries, n_songs, seed=0):
+    # A trained CollaborativeTrainer over synthetic feedback, so recommend
+    # pays for the collaborative half like it does in the server
+    path = os.path.join(workdir, 'feedback.jsonl')
+    write_jsonl_atomic(path, generate_feedback(n_entries, n_songs, seed=seed))
+    trainer = CollaborativeTrainer(open_feedback_store(path))
+    job_id = trainer.submit()
+    while trainer.job(job_id)['status'] in ('queued', 'running'):
+        time.sleep(0.05)
+    return trainer, trainer.job(job_id)
+
+
+def run_micro(n_songs, workdir, seed=0, iterations=200, load_iterations=3, feedback_entries=20_000):
+    results = {}
+    csv_path, seconds = _timed(lambda: write_catalog_csv(os.path.join(workdir, f'catalog_{n_songs}.csv'),
+                                                         n_songs, seed))
+    results['generate_csv_s'] = seconds
+
+    # load_and_preprocess straight from the CSV, then from the compiled cache.
+    # The first load also builds the neighbor table in the background; it is
+    # waited for (and timed) before anything else runs.
+    dp, seconds = _timed(lambda: DataProcessor(csv_path, cache_dir=False))
+    ready, build_seconds = _timed(lambda: dp.get_neighbor_table().wait(NEIGHBOR_TABLE_TIMEOUT))
+    results['neighbor_table'] = {'enabled': dp.get_neighbor_table().enabled, 'ready': ready,
+                                 'wait_after_load_s': build_seconds}
+    cold = [seconds] + [_timed(lambda: DataProcessor(csv_path, cache_dir=False))[1]
+                        for _ in range(load_iterations - 1)]
+    cache_dir = os.path.join(workdir, 'cache')
+    DataProcessor(csv_path, cache_dir=cache_dir)
+    warm = [_timed(lambda: DataProcessor(csv_path, cache_dir=cache_dir))[1] for _ in range(load_iterations)]
+    results['load_and_preprocess'] = {
+        'csv': {'min_s': min(cold), 'mean_s': float(np.mean(cold)), 'runs': len(cold)},
+        'compiled': {'min_s': min(warm), 'mean_s': float(np.mean(warm)), 'runs': len(warm)},
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    trainer, job = train_collaborative(workdir, feedback_entries, n_songs, seed)
+    results['collaborative_train'] = {k: job.get(k) for k in ('status', 'duration', 'users', 'interactions')}
+
+    genres = sorted(dp.get_raw_df()['genre'].unique().tolist())
+    prefs = generate_preferences(iterations, seed=seed, genres=genres)
+    warmup = min(10, iterations // 10)
+    results['transform_user_input'] = measure(dp.transform_user_input, prefs, warmup)
+
+    rec = RecommendationSystem(dp, collaborative=trainer)
+    results['recommend'] = measure(lambda user: rec.recommend(user, top_n=10), prefs, warmup)
+    # Repeated preference combinations, served from the result cache
+    cached = RecommendationSystem(dp, collaborative=trainer, result_cache=ResultCache(max_entries=1024))
+    repeated = generate_preferences(iterations, seed=seed + 1, genres=genres, pool_size=20)
+    results['recommend_cached'] = measure(lambda user: cached.recommend(user, top_n=10), repeated, warmup)
+    results['recommend_cached']['cache'] = cached.result_cache.stats()
+    # Exact scoring on the request thread vs. sharded over every core; both
+    # must return the same songs
+    exact_dp = DataProcessor(csv_path, cache_dir=cache_dir, approximate_index=False)
+    exact = RecommendationSystem(exact_dp, collaborative=trainer)
+    scorer = ShardedScorer(min_rows=0)
+    sharded = RecommendationSystem(exact_dp, collaborative=trainer, scorer=scorer)
+    results['recommend_exact'] = measure(lambda user: exact.recommend(user, top_n=10), prefs, warmup)
+    results['recommend_sharded'] = measure(lambda user: sharded.recommend(user, top_n=10), prefs, warmup)
+    results['recommend_sharded']['workers'] = scorer.workers
+    results['recommend_sharded']['matches_exact'] = all(
+        exact.recommend(user, top_n=10) == sharded.recommend(user, top_n=10) for user in prefs[:20])
+    scorer.close()
+
+    # similar_songs does what the endpoint does: neighbor lookup plus records
+    table = dp.get_neighbor_table()
+    serializer = dp.get_song_serializer()
+    rng = np.random.default_rng(seed)
+
+    def similar(idx):
+        top_idx, top_scores = table.neighbors(int(idx), 10)
+        return serializer.records(top_idx, extra={'score': round_scores(top_scores)})
+    results['similar_songs'] = measure(similar, rng.integers(n_songs, size=iterations), warmup)
+    results['similar_songs']['precomputed'] = table.is_ready()
+
+    # get_songs: random 100-song pages (mostly rendered) and one hot page
+    pages = dp.get_song_pages()
+    offsets = rng.integers(max(n_songs - 100, 1), size=iterations)
+    results['get_songs'] = measure(lambda offset: pages.page(int(offset), 100, SONG_FIELDS), offsets, warmup)
+    results['get_songs_cached'] = measure(lambda offset: pages.page(0, 100, SONG_FIELDS), offsets, warmup)
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
@@ -0,0 +1,107 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+
+def environment():
+    import numpy, pandas, sklearn
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_size(n_songs, args):
+    # Runs in its own process, so peak RSS and imported state belong to
+    # this catalog size only
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    from benchmarks.micro import run_micro
+    workdir = tempfile.mkdtemp(prefix=f'bench-{n_songs}-', dir=args.workdir)
+    result = {'songs': n_songs}
+    if not args.skip_micro:
+        result['micro'] = run_micro(n_songs, workdir, seed=args.seed, iterations=args.iterations,
+                                    load_iterations=args.load_iterations, feedback_entries=args.feedback)
+    return result, workdir
+
+
+def run_load_size(n_songs, args, workdir):
+    # The load driver imports the Flask app, which must happen in a fresh
+    # process with its own working directory
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    from benchmarks.load_driver import run_load
+    from benchmarks.synthetic import write_catalog_csv
+    csv_path = os.path.join(workdir, f'catalog_{n_songs}.csv')
+    if not os.path.exists(csv_path):
+        write_catalog_csv(csv_path, n_songs, args.seed)
+    return run_load(csv_path, n_songs, workdir, seed=args.seed, duration=args.duration,
+                    concurrency=args.concurrency, feedback_entries=args.feedback)
+
+
+def _in_subprocess(fn, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the recommendation backend on synthetic catalogs')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma-separated catalog sizes, e.g. 1000,10000,100000,1000000')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=200, help='timed calls per microbenchmark')
+    parser.add_argument('--load-iterations', type=int, default=3, help='repeats of load_and_preprocess')
+    parser.add_argument('--feedback', type=int, default=20_000, help='synthetic feedback entries')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per load-driver run')
+    parser.add_argument('--concurrency', type=int, default=4, help='load-driver client threads')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--workdir', default=None, help='scratch directory (default: system temp)')
+    parser.add_argument('--keep', action='store_true', help='keep generated catalogs and caches')
+    parser.add_argument('--output', default=None, help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = {'started_at': time.time(), 'environment': environment(), 'config': vars(args), 'runs': []}
+    for n_songs in [int(s) for s in args.sizes.split(',') if s]:
+        print(f'benchmarking {n_songs} songs...', file=sys.stderr)
+        result, workdir = _in_subprocess(run_size, n_songs, args)
+        if not args.skip_load:
+            result['load'] = _in_subprocess(run_load_size, n_songs, args, workdir)
+        report['runs'].append(result)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import time
+import numpy as np
+import pandas as pd
+
+# Numeric columns of mainSong.csv as (header, mean, std, min, max). Means and
+# spreads follow the bundled file, except year, which is widened so year
+# filters have something to select on.
+NUMERIC_COLUMNS = [
+    ('year', 2005, 12, 1950, 2024),
+    ('Beats.Per.Minute -The tempo of the song', 118.5, 24.8, 60, 206),
+    ('Energy- The energy of a song - the higher the value, the more energtic', 70.5, 16.3, 0, 98),
+    ('Danceability - The higher the value, the easier it is to dance to this song', 64.4, 13.4, 0, 97),
+    ('Loudness/dB - The higher the value, the louder the song', -5.6, 2.8, -60, -2),
+    ('Liveness - The higher the value, the more likely the song is a live recording', 17.8, 13.1, 0, 74),
+    ('Valence - The higher the value, the more positive mood for the song', 52.2, 22.5, 0, 98),
+    ('Length - The duration of the song', 224.7, 34.1, 134, 424),
+    ('Acousticness - The higher the value the more acoustic the song is', 14.3, 20.8, 0, 99),
+    ('Speechiness - The higher the value the more spoken word the song contains', 8.4, 7.5, 0, 48),
+    ('Popularity- The higher the value the more popular the song is', 66.5, 14.5, 0, 99),
+]
+
+GENRES = [
+    'dance pop', 'pop', 'canadian pop', 'barbadian pop', 'boy band', 'electropop', 'british soul',
+    'big room', 'neo mellow', 'canadian contemporary r&b', 'hip pop', 'detroit hip hop', 'art pop',
+    'australian dance', 'atl hip hop', 'latin', 'complextro', 'indie pop', 'brostep', 'edm',
+    'acoustic pop', 'folk-pop', 'hollywood', 'electro house', 'permanent wave', 'chicago rap',
+    'tropical house', 'alaska indie', 'irish singer-songwriter', 'candy pop',
+]
+
+MOODS = ['Happy', 'Sad', 'Energetic', 'Chill', 'Romantic', 'Nostalgic', 'Angry', 'Focused']
+
+
+def _zipf_choice(rng, n_values, size, a=1.2):
+    # Skewed picks from range(n_values): a few genres and artists dominate,
+    # like in the real catalog
+    weights = 1.0 / np.arange(1, n_values + 1) ** a
+    return rng.choice(n_values, size=size, p=weights / weights.sum())
+
+
+def generate_catalog(n_songs, seed=0):
+    # A DataFrame with the mainSong.csv header, so it goes through the same
+    # column mapping as the bundled data
+    rng = np.random.default_rng(seed)
+    n_artists = max(10, n_songs // 8)
+    columns = {
+        'title': np.char.add('Song ', np.arange(1, n_songs + 1).astype(str)),
+        'artist': np.char.add('Artist ', _zipf_choice(rng, n_artists, n_songs).astype(str)),
+        'the genre of the track': np.asarray(GENRES)[_zipf_choice(rng, len(GENRES), n_songs)],
+    }
+    for header, mean, std, low, high in NUMERIC_COLUMNS:
+        columns[header] = np.clip(np.rint(rng.normal(mean, std, n_songs)), low, high).astype(np.int64)
+    return pd.DataFrame(columns)
+
+
+def write_catalog_csv(path, n_songs, seed=0):
+    generate_catalog(n_songs, seed).to_csv(path, index=False)
+    return path
+
+
+def generate_preferences(n, seed=0, genres=GENRES, artists=None, pool_size=None):
+    # Preference dicts shaped like the RecommendationForm payload. With
+    # pool_size, requests repeat a fixed set of combinations, as they do in
+    # user_sessions.json.
+    rng = np.random.default_rng(seed)
+    artists = artists or [f'Artist {i}' for i in range(50)]
+    distinct = pool_size or n
+    prefs = []
+    for _ in range(distinct):
+        bpm_min = int(rng.integers(60, 160))
+        year_min = int(rng.integers(1960, 2020))
+        prefs.append({
+            'genre': str(genres[int(rng.integers(len(genres)))]),
+            'artist': str(artists[int(rng.integers(len(artists)))]),
+            'energy': int(rng.integers(0, 101)),
+            'danceability': int(rng.integers(0, 101)),
+            'bpmMin': bpm_min,
+            'bpmMax': bpm_min + int(rng.integers(10, 60)),
+            'yearMin': year_min,
+            'yearMax': min(2024, year_min + int(rng.integers(5, 30))),
+            'mood': str(MOODS[int(rng.integers(len(MOODS)))]),
+        })
+    if distinct == n:
+        return prefs
+    return [prefs[i] for i in rng.integers(distinct, size=n)]
+
+
+def generate_feedback(n_entries, n_songs, seed=0, n_users=200, like_rate=0.7):
+    # Feedback entries as /api/feedback stores them, from n_users distinct
+    # preference profiles with a popularity skew over songs
+    rng = np.random.default_rng(seed)
+    users = generate_preferences(n_users, seed=seed + 1)
+    songs = _zipf_choice(rng, n_songs, n_entries, a=0.8)
+    who = rng.integers(n_users, size=n_entries)
+    likes = rng.random(n_entries) < like_rate
+    now = int(time.time())
+    return [{
+        'song_id': str(int(song)),
+        'feedback': 'like' if like else 'dislike',
+        'timestamp': now - int(n_entries - i),
+        'user_preferences': users[int(u)],
+    } for i, (song, u, like) in enumerate(zip(songs, who, likes))]
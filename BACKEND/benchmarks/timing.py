@@ -0,0 +1,52 @@
+import gc
+import sys
+import time
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process so far
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(latencies, wall_seconds):
+    latencies = np.asarray(latencies, dtype=np.float64) * 1000
+    if len(latencies) == 0:
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'count': int(len(latencies)),
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(latencies.max()),
+        'throughput_per_s': float(len(latencies) / wall_seconds) if wall_seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def measure(fn, inputs, warmup=0):
+    # Calls fn once per input and summarizes the per-call latencies. The first
+    # `warmup` inputs are run untimed; garbage collection is left enabled so
+    # its pauses show up in the tail like they would in the server.
+    inputs = list(inputs)
+    for item in inputs[:warmup]:
+        fn(item)
+    gc.collect()
+    latencies = []
+    started = time.perf_counter()
+    for item in inputs[warmup:]:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
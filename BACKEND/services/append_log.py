@@ -0,0 +1,154 @@
+import atexit
+import json
+import os
+import threading
+import uuid
+
+
+class GroupCommitWriter:
+    # Single background writer that commits whatever has queued up since the
+    # last write as one batch. Concurrent appends share one write (and one
+    # fsync, where the subclass syncs) instead of each paying for their own.
+    # An append that waits is told if its batch failed to commit.
+    def __init__(self, name='group-commit-writer'):
+        self._cond = threading.Condition()
+        self._pending = []
+        self._appended = 0
+        self._committed = 0
+        # Sequence numbers of waiting appends -> error of their batch, if any
+        self._waiters = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def _submit(self, item, wait=False):
+        with self._cond:
+            if self._closed:
+                raise ValueError('writer is closed')
+            self._pending.append(item)
+            self._appended += 1
+            seq = self._appended
+            self._cond.notify_all()
+            if wait:
+                self._waiters[seq] = None
+                while self._committed < seq:
+                    self._cond.wait()
+                error = self._waiters.pop(seq)
+                if error is not None:
+                    raise error
+        return seq
+
+    def flush(self):
+        with self._cond:
+            target = self._appended
+            while self._committed < target:
+                self._cond.wait()
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = self._pending
+                self._pending = []
+            error = None
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print('Error committing batch:', e)
+                error = e
+            with self._cond:
+                if error is not None:
+                    for seq in range(self._committed + 1, self._committed + len(batch) + 1):
+                        if seq in self._waiters:
+                            self._waiters[seq] = error
+                self._committed += len(batch)
+                self._cond.notify_all()
+
+
+class AppendLog(GroupCommitWriter):
+    # JSON-lines file that is only ever appended to. Readers stream it line by
+    # line, so the cost of an append no longer depends on the size of history.
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._file = None
+        super().__init__(name=f'append-log:{os.path.basename(path)}')
+
+    def append(self, record, wait=False):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        return self._submit(line, wait=wait)
+
+    def _write_batch(self, batch):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(''.join(batch))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def iter_records(self):
+        self.flush()
+        yield from iter_jsonl(self.path)
+
+    def close(self):
+        super().close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def iter_jsonl(path):
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-write; skip it.
+                continue
+
+
+def write_jsonl_atomic(path, records, overwrite=True):
+    # The temp file is private to this call, so processes starting together
+    # never write into each other's. With overwrite=False an existing file
+    # is left alone (os.link refuses to replace it): the first of several
+    # concurrent migrations wins and the rest are dropped.
+    tmp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if overwrite:
+            os.replace(tmp_path, path)
+        else:
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
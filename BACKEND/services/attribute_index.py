@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+# Range filters: column -> (min key, max key) in the preference payload
+RANGE_FILTERS = {'bpm': ('bpmMin', 'bpmMax'), 'year': ('yearMin', 'yearMax')}
+# Exact-match filters on these columns; a value may also be a list (any of)
+CATEGORY_FILTERS = ['genre', 'artist', 'mood']
+
+
+def normalize_label(value):
+    return str(value).strip().casefold()
+
+
+def _labels(values):
+    values = values if isinstance(values, (list, tuple)) else [values]
+    return tuple(sorted({normalize_label(v) for v in values if v not in (None, '')}))
+
+
+def category_key(user):
+    # Hashable CATEGORY_FILTERS choices of a preference dict, whatever the
+    # catalog; None for anything that is not a dict
+    if not isinstance(user, dict):
+        return None
+    return tuple((col, _labels(user.get(col))) for col in CATEGORY_FILTERS)
+
+
+class RangeIndex:
+    # Rows sorted by value once per load; a range is two binary searches and
+    # a contiguous slice of row ids
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.order = np.argsort(values, kind='stable')
+        self.sorted = values[self.order]
+
+    def rows(self, low=None, high=None):
+        lo = 0 if low is None else np.searchsorted(self.sorted, low, side='left')
+        hi = len(self.sorted) if high is None else np.searchsorted(self.sorted, high, side='right')
+        return self.order[lo:max(lo, hi)]
+
+
+class InvertedIndex:
+    # Posting list of row ids per distinct (case-folded) value, stored as one
+    # array of rows grouped by value plus offsets into it
+    def __init__(self, values):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object).map(normalize_label))
+        self.lookup = {value: i for i, value in enumerate(uniques)}
+        self.counts = np.bincount(codes, minlength=len(uniques))
+        self.order = np.argsort(codes, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+
+    def rows(self, value):
+        i = self.lookup.get(normalize_label(value))
+        if i is None:
+            return self.order[:0]
+        return self.order[self.offsets[i]:self.offsets[i + 1]]
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AttributeIndex:
+    # Secondary indexes over the raw catalog columns the recommendation form
+    # can constrain. constraints() normalizes a preference payload; mask()
+    # turns the constraints into a candidate bitmap, so only matching rows
+    # are scored.
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self.ranges = {col: RangeIndex(df[col].to_numpy()) for col in RANGE_FILTERS if col in df.columns}
+        self.categories = {col: InvertedIndex(df[col].to_numpy()) for col in CATEGORY_FILTERS if col in df.columns}
+
+    def constraints(self, user):
+        # Hashable, order-independent constraints; empty values and columns
+        # the catalog does not have are ignored
+        found = []
+        for col, (min_key, max_key) in RANGE_FILTERS.items():
+            if col not in self.ranges:
+                continue
+            low, high = _number(user.get(min_key)), _number(user.get(max_key))
+            if low is not None or high is not None:
+                found.append((col, (low, high)))
+        for col in CATEGORY_FILTERS:
+            if col not in self.categories:
+                continue
+            labels = _labels(user.get(col))
+            if labels:
+                found.append((col, labels))
+        return tuple(found)
+
+    def mask(self, constraints):
+        # Boolean row mask for the constraints, or None when unconstrained
+        if not constraints:
+            return None
+        mask = None
+        for col, spec in constraints:
+            if col in self.ranges:
+                rows = self.ranges[col].rows(*spec)
+            else:
+                index = self.categories[col]
+                rows = np.concatenate([index.rows(value) for value in spec])
+            selected = np.zeros(self.n_rows, dtype=bool)
+            selected[rows] = True
+            mask = selected if mask is None else mask & selected
+        return mask
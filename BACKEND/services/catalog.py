@@ -0,0 +1,313 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from services.data_processor import DataProcessor, file_sha1
+from services.recommendation_system import RecommendationSystem
+from services.metrics import metrics
+
+CATALOG_LOADS = metrics.histogram('catalog_load_seconds', 'Dataset load and reload durations', ('csv_type',))
+
+
+def source_key(path):
+    # Cheap stand-in for the content hash: a file that still has the same
+    # size and mtime is taken to be unchanged
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+class CatalogSnapshot:
+    # Everything derived from one dataset load. Snapshots are never mutated
+    # after construction: a reload builds a new one, so a request that pinned
+    # a snapshot sees one consistent dataset from start to finish.
+    def __init__(self, data_processor, recommender, csv_type):
+        self.data_processor = data_processor
+        self.recommender = recommender
+        self.csv_type = csv_type
+        self.path = data_processor.data_path
+        self.version = data_processor.version
+        self.loaded_at = time.time()
+
+    @property
+    def nbytes(self):
+        # Grows once the neighbor table finishes building in the background
+        return self.data_processor.memory_usage()
+
+
+class CatalogManager:
+    # Holds the current snapshot and loads replacements on a background
+    # thread. Swapping is a single reference assignment, so readers never
+    # block on a load and never see a half-built catalog.
+    def __init__(self, collaborative=None, result_cache=None, on_swap=None, scorer=None):
+        self.collaborative = collaborative
+        self.result_cache = result_cache
+        self.scorer = scorer
+        # Called after a background load swaps a new snapshot in
+        self.on_swap = on_swap
+        self._snapshot = None
+        # source_key() of the file the current snapshot was built from
+        self._source = None
+        self._lock = threading.Lock()
+        self._ensure_lock = threading.Lock()
+        self._requested = None
+        self._worker = None
+        self._loading = None
+        self._last_load = None
+        self._error = None
+
+    def current(self):
+        return self._snapshot
+
+    def build(self, path, csv_type):
+        started = time.time()
+        data_processor = DataProcessor(path)
+        recommender = RecommendationSystem(data_processor, collaborative=self.collaborative,
+                                           result_cache=self.result_cache, scorer=self.scorer)
+        snapshot = CatalogSnapshot(data_processor, recommender, csv_type)
+        seconds = time.time() - started
+        CATALOG_LOADS.labels(csv_type).observe(seconds)
+        self._last_load = {'csv_type': csv_type, 'version': snapshot.version, 'seconds': seconds}
+        return snapshot
+
+    def load(self, path, csv_type):
+        source = source_key(path)
+        snapshot = self.build(path, csv_type)
+        self._snapshot, self._source = snapshot, source
+        return snapshot
+
+    def ensure(self, path, csv_type):
+        # Current snapshot, loading it in this thread if there is none yet.
+        # Concurrent callers, and a background load already under way, share
+        # the one build instead of starting another.
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self._ensure_lock:
+            if self._snapshot is None:
+                self.load(path, csv_type)
+            return self._snapshot
+
+    def evict(self):
+        # Requests that already pinned the snapshot keep it alive until done
+        self._snapshot = None
+
+    def load_async(self, path, csv_type, on_ready=None):
+        # Requests made while a load is running are coalesced: only the most
+        # recent one is built once the current load finishes. Asking for the
+        # dataset that is already current or in flight is a no-op, judged by
+        # source_key() so the request thread never reads the file; the
+        # loader hashes it and skips the build if only the mtime changed.
+        # on_ready is called once the requested dataset is the current
+        # snapshot, and not at all if the load fails or a newer request
+        # supersedes it.
+        key = source_key(path)
+        callbacks = [on_ready] if on_ready else []
+        with self._lock:
+            snapshot = self._snapshot
+            if self._requested is None:
+                in_flight = self._loading and self._loading['key']
+                if in_flight and key == in_flight:
+                    self._loading['callbacks'] += callbacks
+                    return False
+                ready = not in_flight and snapshot is not None and key == self._source
+            else:
+                ready = False
+                if self._requested[2] == key:
+                    callbacks = self._requested[3] + callbacks
+            if not ready:
+                self._requested = (path, csv_type, key, callbacks)
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name='catalog-loader', daemon=True)
+                    self._worker.start()
+        if ready:
+            for callback in callbacks:
+                callback()
+        return not ready
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._requested is None:
+                    self._worker = None
+                    self._loading = None
+                    return
+                path, csv_type, key, callbacks = self._requested
+                self._requested = None
+                self._loading = {'csv_type': csv_type, 'path': os.path.basename(path),
+                                 'started_at': time.time(), 'key': key, 'callbacks': callbacks}
+            # Held through the swap, so ensure() waits for this build
+            with self._ensure_lock:
+                current = self._snapshot
+                try:
+                    if current is not None and current.path == path and current.version == file_sha1(path)[:16]:
+                        # Touched but not changed
+                        snapshot = current
+                    else:
+                        snapshot = self.build(path, csv_type)
+                    error = None
+                except Exception as e:
+                    snapshot, error = None, str(e)
+                with self._lock:
+                    self._error = error
+                    # A newer request supersedes this result
+                    ready = snapshot is not None and self._requested is None
+                    if ready:
+                        self._snapshot, self._source = snapshot, key
+                    callbacks = self._loading['callbacks']
+            if ready:
+                if snapshot is not current and self.on_swap:
+                    self.on_swap()
+                for callback in callbacks:
+                    callback()
+
+    def status(self):
+        snapshot = self._snapshot
+        with self._lock:
+            loading = self._loading or (self._requested and {'csv_type': self._requested[1],
+                                                             'path': os.path.basename(self._requested[0])})
+            if loading:
+                loading = {k: v for k, v in loading.items() if k not in ('key', 'callbacks')}
+            if loading:
+                state = 'loading'
+            elif self._error:
+                state = 'failed'
+            else:
+                state = 'ready' if snapshot else 'unloaded'
+            return {
+                'state': state,
+                'csv_type': snapshot.csv_type if snapshot else None,
+                'version': snapshot.version if snapshot else None,
+                'loaded_at': snapshot.loaded_at if snapshot else None,
+                'loading': loading or None,
+                'last_load': self._last_load,
+                'error': self._error,
+            }
+
+
+class UnknownCatalogError(KeyError):
+    pass
+
+
+class CatalogRegistry:
+    # Several named catalogs (default, user upload, tenants) resident at
+    # once, each behind its own CatalogManager with its own indexes, so a
+    # request picks one by name instead of flipping a global mode.
+    # resolve_path(name) maps a name to its CSV, or None if the name is not
+    # valid. A catalog is loaded on first use; when the resident catalogs
+    # exceed memory_budget bytes, the least recently used ones are evicted
+    # and reload (from the compiled cache) on their next request.
+    def __init__(self, resolve_path, collaborative=None, result_cache=None, memory_budget=None, scorer=None):
+        self.resolve_path = resolve_path
+        self.collaborative = collaborative
+        self.result_cache = result_cache
+        # ShardedScorer shared by every catalog's recommender
+        self.scorer = scorer
+        self.memory_budget = memory_budget
+        # Rows of the largest catalog loaded so far
+        self.max_rows = 0
+        self._managers = {}
+        self._last_used = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        path = self.resolve_path(name)
+        if path is None or not os.path.exists(path):
+            raise UnknownCatalogError(name)
+        return path
+
+    def _manager(self, name):
+        with self._lock:
+            manager = self._managers.get(name)
+            if manager is None:
+                manager = CatalogManager(collaborative=self.collaborative, result_cache=self.result_cache,
+                                         on_swap=lambda: self._loaded(name), scorer=self.scorer)
+                self._managers[name] = manager
+            return manager
+
+    def _touch(self, name):
+        with self._lock:
+            self._last_used[name] = time.time()
+            self._last_used.move_to_end(name)
+
+    def get(self, name):
+        manager = self._managers.get(name)
+        snapshot = manager.current() if manager is not None else None
+        if snapshot is None:
+            path = self._path(name)
+            snapshot = self._manager(name).ensure(path, name)
+            self._loaded(name)
+        self._touch(name)
+        return snapshot
+
+    def load(self, name):
+        path = self._path(name)
+        snapshot = self._manager(name).load(path, name)
+        self._touch(name)
+        self._loaded(name)
+        return snapshot
+
+    def load_async(self, name, on_ready=None):
+        path = self._path(name)
+        self._touch(name)
+        return self._manager(name).load_async(path, name, on_ready=on_ready)
+
+    def evict(self, name):
+        manager = self._managers.get(name)
+        if manager is not None:
+            manager.evict()
+
+    def resident(self):
+        # {name: snapshot} for every loaded catalog
+        with self._lock:
+            managers = list(self._managers.items())
+        return {name: m.current() for name, m in managers if m.current() is not None}
+
+    def memory_usage(self):
+        return sum(snapshot.nbytes for snapshot in self.resident().values())
+
+    def _loaded(self, name):
+        snapshot = self._managers[name].current()
+        if snapshot is not None:
+            self.max_rows = max(self.max_rows, len(snapshot.data_processor.get_raw_df()))
+        self._enforce_budget(keep=name)
+
+    def _enforce_budget(self, keep=None):
+        if self.memory_budget is None:
+            return
+        resident = self.resident()
+        total = sum(snapshot.nbytes for snapshot in resident.values())
+        with self._lock:
+            order = [name for name in self._last_used if name in resident]
+        for name in order:
+            if total <= self.memory_budget:
+                break
+            if name == keep:
+                continue
+            self.evict(name)
+            total -= resident[name].nbytes
+
+    def status(self, name):
+        manager = self._managers.get(name)
+        if manager is None:
+            self._path(name)
+            return {'state': 'unloaded', 'csv_type': name, 'version': None, 'loaded_at': None,
+                    'loading': None, 'last_load': None, 'error': None}
+        return manager.status()
+
+    def stats(self):
+        with self._lock:
+            names = list(self._managers)
+            last_used = dict(self._last_used)
+        catalogs = []
+        for name in names:
+            snapshot = self._managers[name].current()
+            catalogs.append({
+                'name': name,
+                'state': self._managers[name].status()['state'],
+                'version': snapshot.version if snapshot else None,
+                'rows': len(snapshot.data_processor.get_raw_df()) if snapshot else None,
+                'bytes': snapshot.nbytes if snapshot else 0,
+                'last_used': last_used.get(name),
+            })
+        return {'catalogs': catalogs, 'memory_bytes': sum(c['bytes'] for c in catalogs),
+                'memory_budget_bytes': self.memory_budget}
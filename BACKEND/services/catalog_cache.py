@@ -0,0 +1,276 @@
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+# Bump when the on-disk layout or the preprocessing that feeds it changes
+FORMAT_VERSION = 4
+# Compiled catalogs kept beyond one per CSV sharing the cache directory
+PRUNE_SPARE = 4
+# String columns with more distinct values than this are stored plain
+# (one offset per row) instead of dictionary-encoded
+MAX_DICTIONARY_SIZE = 65536
+
+
+def _map(path, dtype):
+    # Read-only view of a raw little-endian column file; mmap cannot map an
+    # empty file, so empty columns come back as empty arrays
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+class _StringColumnWriter:
+    # Streams a string column to disk as offset-encoded UTF-8. Both a plain
+    # encoding (one offset per row) and a dictionary encoding (distinct values
+    # plus an int32 code per row) are written while the column stays under
+    # MAX_DICTIONARY_SIZE distinct values; the dictionary wins if it fits.
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self._data = open(os.path.join(directory, name + '.plain.data.bin'), 'wb')
+        self._offsets = open(os.path.join(directory, name + '.plain.offsets.bin'), 'wb')
+        self._nulls = open(os.path.join(directory, name + '.plain.nulls.bin'), 'wb')
+        self._codes = open(os.path.join(directory, name + '.codes.bin'), 'wb')
+        self._position = 0
+        self._offsets.write(np.zeros(1, dtype='<i8').tobytes())
+        self._dictionary = {}
+
+    def append(self, values):
+        nulls = np.asarray(pd.isna(values), dtype=bool)
+        texts = ['' if null else str(v) for v, null in zip(values, nulls)]
+        lengths = np.fromiter((len(t) for t in texts), dtype='<i8', count=len(texts))
+        self._data.write(''.join(texts).encode('utf-8'))
+        self._offsets.write((self._position + np.cumsum(lengths)).astype('<i8').tobytes())
+        self._position += int(lengths.sum())
+        self._nulls.write(nulls.tobytes())
+        if self._dictionary is not None:
+            codes = np.empty(len(texts), dtype='<i4')
+            for i, (text, null) in enumerate(zip(texts, nulls)):
+                codes[i] = -1 if null else self._dictionary.setdefault(text, len(self._dictionary))
+            self._codes.write(codes.tobytes())
+            if len(self._dictionary) > MAX_DICTIONARY_SIZE:
+                self._dictionary = None
+
+    def close(self):
+        for f in (self._data, self._offsets, self._nulls, self._codes):
+            f.close()
+        if self._dictionary is None:
+            os.remove(os.path.join(self.directory, self.name + '.codes.bin'))
+            return 'plain'
+        texts = list(self._dictionary)
+        offsets = np.zeros(len(texts) + 1, dtype='<i8')
+        np.cumsum([len(t) for t in texts], out=offsets[1:])
+        with open(os.path.join(self.directory, self.name + '.data.bin'), 'wb') as f:
+            f.write(''.join(texts).encode('utf-8'))
+        offsets.tofile(os.path.join(self.directory, self.name + '.offsets.bin'))
+        for suffix in ('.plain.data.bin', '.plain.offsets.bin', '.plain.nulls.bin'):
+            os.remove(os.path.join(self.directory, self.name + suffix))
+        return 'dict'
+
+
+def _read_strings(directory, column):
+    name = column['file']
+    prefix = '.plain' if column['encoding'] == 'plain' else ''
+    with open(os.path.join(directory, name + prefix + '.data.bin'), 'rb') as f:
+        text = f.read().decode('utf-8')
+    offsets = _map(os.path.join(directory, name + prefix + '.offsets.bin'), '<i8').tolist()
+    values = np.empty(len(offsets), dtype=object)
+    values[:-1] = list(map(text.__getitem__, map(slice, offsets[:-1], offsets[1:])))
+    if column['encoding'] == 'plain':
+        values = values[:-1]
+        values[_map(os.path.join(directory, name + '.plain.nulls.bin'), bool)] = np.nan
+        return values
+    # The extra trailing slot holds the null marker for code -1, so
+    # low-cardinality columns decode with a single take()
+    values[-1] = np.nan
+    return values[_map(os.path.join(directory, name + '.codes.bin'), '<i4')]
+
+
+def scaler_params(scaler):
+    seen = scaler.n_samples_seen_
+    return {
+        'mean': scaler.mean_.tolist(),
+        'scale': scaler.scale_.tolist(),
+        'var': scaler.var_.tolist(),
+        'n_samples_seen': seen.tolist() if isinstance(seen, np.ndarray) else int(seen),
+    }
+
+
+def scaler_from_params(params):
+    scaler = StandardScaler()
+    scaler.mean_ = np.array(params['mean'])
+    scaler.scale_ = np.array(params['scale'])
+    scaler.var_ = np.array(params['var'])
+    seen = params['n_samples_seen']
+    scaler.n_samples_seen_ = np.array(seen) if isinstance(seen, list) else seen
+    scaler.n_features_in_ = len(scaler.mean_)
+    return scaler
+
+
+class CatalogWriter:
+    # Builds a compiled catalog incrementally in a private temp directory and
+    # renames it into place on finish, so concurrent workers never see a
+    # partial entry. Columns are appended chunk by chunk; matrices are written
+    # whole or through open_matrix memmaps.
+    def __init__(self, cache_dir, key, feature_cols):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.final_dir = os.path.join(cache_dir, key)
+        self.directory = os.path.join(cache_dir, f'.{key}.{os.getpid()}.{uuid.uuid4().hex[:8]}')
+        os.makedirs(self.directory)
+        self.feature_cols = list(feature_cols)
+        self._columns = {}
+
+    def append_columns(self, df):
+        # Column kinds and numeric dtypes are fixed by the first chunk a
+        # column appears in, except that a numeric column (e.g. all NaN so
+        # far) becomes a string column once a chunk holds text
+        for col in df.columns:
+            column = self._columns.get(col)
+            if column is None:
+                name = f'col{len(self._columns)}'
+                if pd.api.types.is_numeric_dtype(df[col]):
+                    column = {'name': col, 'file': name, 'kind': 'numeric', 'dtype': df[col].dtype.str,
+                              'writer': open(os.path.join(self.directory, name + '.bin'), 'wb')}
+                else:
+                    column = {'name': col, 'file': name, 'kind': 'string',
+                              'writer': _StringColumnWriter(self.directory, name)}
+                self._columns[col] = column
+            elif column['kind'] == 'numeric' and not pd.api.types.is_numeric_dtype(df[col]):
+                self._to_strings(column)
+            if column['kind'] == 'numeric':
+                column['writer'].write(np.asarray(df[col].to_numpy(), dtype=column['dtype']).tobytes())
+            else:
+                column['writer'].append(df[col].to_numpy(dtype=object))
+
+    def _to_strings(self, column):
+        # Rewrites the rows written so far as a string column
+        column['writer'].close()
+        path = os.path.join(self.directory, column['file'] + '.bin')
+        values = np.fromfile(path, dtype=column['dtype'])
+        os.remove(path)
+        column['writer'] = _StringColumnWriter(self.directory, column['file'])
+        column['writer'].append(values.astype(object))
+        column['kind'] = 'string'
+        del column['dtype']
+
+    def open_matrix(self, name, shape, dtype):
+        return np.lib.format.open_memmap(os.path.join(self.directory, name + '.npy'), mode='w+',
+                                         dtype=dtype, shape=shape)
+
+    def write_matrix(self, name, matrix):
+        np.save(os.path.join(self.directory, name + '.npy'), np.asarray(matrix))
+
+    def finish(self, rows, scaler, column_order=None):
+        columns = []
+        for col in column_order or list(self._columns):
+            column = self._columns[col]
+            if column['kind'] == 'numeric':
+                column['writer'].close()
+            else:
+                column['encoding'] = column['writer'].close()
+            columns.append({k: v for k, v in column.items() if k != 'writer'})
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'rows': rows,
+            'feature_cols': self.feature_cols,
+            'columns': columns,
+            'scaler': scaler_params(scaler),
+        }
+        with open(os.path.join(self.directory, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        try:
+            os.replace(self.directory, self.final_dir)
+        except OSError:
+            # Another worker compiled the same content first
+            self.abort()
+            if not os.path.isdir(self.final_dir):
+                raise
+
+    def abort(self):
+        for column in self._columns.values():
+            try:
+                column['writer'].close()
+            except Exception:
+                pass
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def write_catalog(cache_dir, key, df, feature_cols, scaler, scaled, normalized):
+    writer = CatalogWriter(cache_dir, key, feature_cols)
+    try:
+        writer.append_columns(df)
+        writer.write_matrix('scaled', scaled)
+        writer.write_matrix('normalized', normalized)
+        writer.finish(len(df), scaler)
+    except Exception:
+        writer.abort()
+        raise
+
+
+class CompiledCatalog:
+    # A compiled catalog opened from disk. The matrices and numeric columns
+    # are memory-mapped read-only and used in place, so processes opening
+    # the same entry share its page-cache pages; string columns are decoded
+    # into each process's own memory.
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.manifest = manifest
+        self.feature_cols = manifest['feature_cols']
+        self.scaled = np.load(os.path.join(directory, 'scaled.npy'), mmap_mode='r')
+        self.normalized = np.load(os.path.join(directory, 'normalized.npy'), mmap_mode='r')
+        self.scaler = scaler_from_params(manifest['scaler'])
+
+    def to_dataframe(self):
+        data = {}
+        for column in self.manifest['columns']:
+            if column['kind'] == 'numeric':
+                data[column['name']] = _map(os.path.join(self.directory, column['file'] + '.bin'), column['dtype'])
+            else:
+                data[column['name']] = _read_strings(self.directory, column)
+        # copy=False keeps the numeric columns backed by the memmaps
+        return pd.DataFrame(data, copy=False)
+
+
+def open_catalog(cache_dir, key, feature_cols):
+    directory = os.path.join(cache_dir, key)
+    try:
+        with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format_version') != FORMAT_VERSION or manifest.get('feature_cols') != list(feature_cols):
+        return None
+    try:
+        # Marks the entry as recently used for prune_cache
+        os.utime(directory)
+        return CompiledCatalog(directory, manifest)
+    except (OSError, ValueError) as e:
+        # Pruned by another load after the manifest was read
+        print('Error opening compiled catalog:', e)
+        return None
+
+
+def prune_cache(cache_dir, keep=None):
+    # Drops all but the most recently used compiled catalogs. By default one
+    # entry is kept per CSV next to the cache directory (every catalog that
+    # compiles into it) plus PRUNE_SPARE, so loading one catalog never
+    # prunes another that is still around.
+    if keep is None:
+        try:
+            csvs = [name for name in os.listdir(os.path.dirname(os.path.abspath(cache_dir)))
+                    if name.lower().endswith('.csv')]
+        except OSError:
+            csvs = []
+        keep = len(csvs) + PRUNE_SPARE
+    try:
+        entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if not name.startswith('.')]
+    except OSError:
+        return
+    entries = [e for e in entries if os.path.isdir(e)]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for stale in entries[keep:]:
+        shutil.rmtree(stale, ignore_errors=True)
@@ -0,0 +1,226 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+from services.metrics import metrics
+from services.data_processor import PROFILE_FIELDS, profile_values
+
+TRAINING_RUNS = metrics.histogram('collaborative_train_seconds', 'ALS training job durations')
+
+# Feedback for song ids at or above this is ignored when the trainer is not
+# given a tighter bound; the item factors are sized by the largest id
+MAX_ITEMS = 10_000_000
+
+
+def preference_key(prefs):
+    # Pseudo-users are identified by their exact preference dict
+    return json.dumps(prefs or {}, sort_keys=True)
+
+
+def build_interactions(entries, max_items=MAX_ITEMS):
+    # Sparse (pseudo-user x song) matrix of summed feedback: +1 per like,
+    # -1 per dislike. Entries whose song id is not a row index below
+    # max_items, or whose
+    # preferences cannot be turned into a feature vector, are skipped.
+    user_index = {}
+    user_prefs = []
+    profiles = []
+    rows, cols, vals = [], [], []
+    n_entries = 0
+    for entry in entries:
+        n_entries += 1
+        try:
+            song = int(entry.get('song_id'))
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= song < max_items or entry.get('feedback') not in ('like', 'dislike'):
+            continue
+        prefs = entry.get('user_preferences')
+        prefs = {} if prefs is None else prefs
+        key = preference_key(prefs)
+        if key not in user_index:
+            profile = profile_values(prefs)
+            if profile is None:
+                continue
+            user_index[key] = len(user_prefs)
+            user_prefs.append(prefs)
+            profiles.append(profile)
+        rows.append(user_index[key])
+        cols.append(song)
+        vals.append(1.0 if entry['feedback'] == 'like' else -1.0)
+    n_items = max(cols) + 1 if cols else 0
+    matrix = sp.coo_matrix((vals, (rows, cols)), shape=(len(user_prefs), n_items)).tocsr()
+    matrix.sum_duplicates()
+    profiles = np.array(profiles, dtype=np.float64).reshape(-1, len(PROFILE_FIELDS))
+    return matrix, user_index, user_prefs, profiles, n_entries
+
+
+def _als_step(interactions, fixed, regularization, alpha):
+    # One half-step of implicit ALS (Hu, Koren & Volinsky): solve every row's
+    # factors against the fixed side. Preference is 1 for net likes and 0
+    # otherwise; confidence grows with the magnitude of the feedback, so
+    # repeated dislikes are confident negatives.
+    n_factors = fixed.shape[1]
+    gram = fixed.T @ fixed
+    reg = regularization * np.eye(n_factors)
+    solved = np.zeros((interactions.shape[0], n_factors))
+    indptr, indices, data = interactions.indptr, interactions.indices, interactions.data
+    for row in range(interactions.shape[0]):
+        cols = indices[indptr[row]:indptr[row + 1]]
+        if len(cols) == 0:
+            continue
+        values = data[indptr[row]:indptr[row + 1]]
+        confidence = 1.0 + alpha * np.abs(values)
+        preference = (values > 0).astype(np.float64)
+        factors = fixed[cols]
+        a = gram + factors.T @ ((confidence - 1.0)[:, None] * factors) + reg
+        b = factors.T @ (confidence * preference)
+        solved[row] = np.linalg.solve(a, b)
+    return solved
+
+
+class ALSModel:
+    def __init__(self, user_factors, item_factors, user_index, user_prefs, profiles, n_entries, version=None):
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.user_index = user_index
+        self.user_prefs = user_prefs
+        # PROFILE_FIELDS values per pseudo-user, validated when training, so
+        # requests only ever scale them
+        self.profiles = profiles
+        self.n_entries = n_entries
+        self.version = version or uuid.uuid4().hex[:12]
+
+    @classmethod
+    def train(cls, interactions, user_index, user_prefs, profiles, n_entries, factors=32, iterations=15,
+              regularization=0.1, alpha=20.0, warm_start=None, random_state=0):
+        rng = np.random.default_rng(random_state)
+        n_users, n_items = interactions.shape
+        user_factors = rng.normal(scale=0.01, size=(n_users, factors))
+        item_factors = rng.normal(scale=0.01, size=(n_items, factors))
+        if warm_start is not None and warm_start.item_factors.shape[1] == factors:
+            # Continue from the last checkpoint for the users and songs it knows
+            shared = min(n_items, warm_start.item_factors.shape[0])
+            item_factors[:shared] = warm_start.item_factors[:shared]
+            for key, row in user_index.items():
+                old_row = warm_start.user_index.get(key)
+                if old_row is not None:
+                    user_factors[row] = warm_start.user_factors[old_row]
+        by_item = interactions.T.tocsr()
+        for _ in range(iterations):
+            user_factors = _als_step(interactions, item_factors, regularization, alpha)
+            item_factors = _als_step(by_item, user_factors, regularization, alpha)
+        return cls(user_factors, item_factors, user_index, user_prefs, profiles, n_entries)
+
+    def item_scores(self, user_row, n_items):
+        # Scores for the first n_items songs, scaled to [0, 1]
+        scores = np.zeros(n_items, dtype=np.float32)
+        shared = min(n_items, self.item_factors.shape[0])
+        raw = self.item_factors[:shared] @ self.user_factors[user_row]
+        top = raw.max() if shared else 0
+        if top > 0:
+            scores[:shared] = np.clip(raw / top, 0, 1)
+        return scores
+
+    def save(self, path):
+        # Private to this process; every worker trains and saves on startup
+        tmp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, user_factors=self.user_factors, item_factors=self.item_factors,
+                         user_keys=np.array(json.dumps(sorted(self.user_index, key=self.user_index.get))),
+                         user_prefs=np.array(json.dumps(self.user_prefs)), profiles=self.profiles,
+                         n_entries=np.array(self.n_entries), version=np.array(self.version))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            keys = json.loads(str(data['user_keys']))
+            user_prefs = json.loads(str(data['user_prefs']))
+            if 'profiles' in data:
+                profiles = data['profiles']
+            else:
+                # Older checkpoints; malformed preferences become NaN rows,
+                # which never match
+                nan = [np.nan] * len(PROFILE_FIELDS)
+                profiles = np.array([profile_values(prefs) or nan for prefs in user_prefs],
+                                    dtype=np.float64).reshape(-1, len(PROFILE_FIELDS))
+            return cls(data['user_factors'], data['item_factors'], {k: i for i, k in enumerate(keys)},
+                       user_prefs, profiles, int(data['n_entries']), str(data['version']))
+
+
+class CollaborativeTrainer:
+    # Trains the ALS model from the feedback store on a single background
+    # worker and swaps it in with one reference assignment when done. Each
+    # job warm-starts from the current model and is skipped when no feedback
+    # has arrived since it was trained.
+    def __init__(self, feedback_store, checkpoint_path=None, factors=32, iterations=15,
+                 incremental_iterations=5, regularization=0.1, alpha=20.0, max_items=MAX_ITEMS):
+        self.feedback_store = feedback_store
+        self.checkpoint_path = checkpoint_path
+        # Bound on song ids, or a callable returning one (None for MAX_ITEMS)
+        self.max_items = max_items
+        self.factors = factors
+        self.iterations = iterations
+        self.incremental_iterations = incremental_iterations
+        self.regularization = regularization
+        self.alpha = alpha
+        self.model = None
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cf-train')
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            try:
+                self.model = ALSModel.load(checkpoint_path)
+            except Exception as e:
+                print('Error loading collaborative checkpoint:', e)
+
+    def submit(self):
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self.jobs[job_id] = {'id': job_id, 'status': 'queued', 'submitted_at': time.time()}
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def job(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self.jobs[job_id].update(fields)
+
+    def _run(self, job_id):
+        started = time.time()
+        self._update(job_id, status='running', started_at=started)
+        try:
+            max_items = self.max_items() if callable(self.max_items) else self.max_items
+            interactions, user_index, user_prefs, profiles, n_entries = build_interactions(
+                self.feedback_store.iter_entries(), max_items=max_items or MAX_ITEMS)
+            previous = self.model
+            if previous is not None and previous.n_entries == n_entries:
+                self._update(job_id, status='done', skipped=True, model_version=previous.version,
+                             finished_at=time.time())
+                return
+            iterations = self.iterations if previous is None else self.incremental_iterations
+            model = ALSModel.train(interactions, user_index, user_prefs, profiles, n_entries, factors=self.factors,
+                                   iterations=iterations, regularization=self.regularization,
+                                   alpha=self.alpha, warm_start=previous)
+            self.model = model
+            TRAINING_RUNS.labels().observe(time.time() - started)
+            if self.checkpoint_path:
+                model.save(self.checkpoint_path)
+            self._update(job_id, status='done', skipped=False, model_version=model.version,
+                         users=interactions.shape[0], interactions=int(interactions.nnz),
+                         finished_at=time.time(), duration=time.time() - started)
+        except Exception as e:
+            self._update(job_id, status='failed', error=str(e), finished_at=time.time())
@@ -2,10 +2,53 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 import os
+import hashlib
+from services.item_index import ItemIndex, IVFIndex, ANN_MIN_ITEMS
+from services.neighbor_table import NeighborTable
+from services.attribute_index import AttributeIndex
+from services.facet_index import FacetIndex
+from services.song_serializer import SongSerializer, SongPageCache
+from services.catalog_cache import open_catalog, write_catalog, prune_cache
+from services.metrics import PIPELINE_STAGES
+
+
+# Preference fields that shape a user's feature vector, with the value used
+# when a user leaves one out
+PROFILE_FIELDS = (('bpmMin', 60), ('energy', 50), ('danceability', 50), ('yearMin', 1990))
+
+
+def profile_values(user):
+    # The PROFILE_FIELDS of one preference dict as floats, or None when the
+    # dict is malformed (not a dict, or a non-numeric value)
+    if not isinstance(user, dict):
+        return None
+    values = []
+    for field, default in PROFILE_FIELDS:
+        try:
+            value = float(user.get(field, default))
+        except (TypeError, ValueError):
+            return None
+        if not np.isfinite(value):
+            return None
+        values.append(value)
+    return values
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
 
 class DataProcessor:
-    def __init__(self, data_path):
+    def __init__(self, data_path, approximate_index=None, cache_dir=None, load=True):
         self.data_path = data_path
+        # Compiled catalogs keyed by CSV content hash; False disables the cache
+        self.cache_dir = os.path.join(os.path.dirname(data_path), 'cache') if cache_dir is None else cache_dir
+        # None builds the approximate index only for catalogs of ANN_MIN_ITEMS or more
+        self.approximate_index = approximate_index
         self.col_map = {
             'the genre of the track': 'genre',
             'Beats.Per.Minute -The tempo of the song': 'bpm',
@@ -23,60 +66,99 @@ class DataProcessor:
             'BPM': 'bpm',
         }
         self.feature_cols = ['bpm', 'energy', 'danceability', 'loudness', 'liveness', 'valence', 'duration', 'acousticness', 'speechiness', 'popularity', 'year']
+        # Used both for missing columns and for NaNs in these columns; any
+        # other missing feature column defaults to 0
+        self.feature_defaults = {
+            'energy': 50, 'danceability': 50, 'loudness': -10,
+            'liveness': 10, 'valence': 50, 'acousticness': 20,
+            'speechiness': 5, 'popularity': 50
+        }
+        # NaNs in these columns are filled with the column mean instead
+        self.mean_filled_cols = ['bpm', 'duration', 'year']
         self.df = None
         self.scaler = None
         self.df_scaled = None
-        self.load_and_preprocess()
+        self.item_index = None
+        self.ann_index = None
+        self.neighbor_table = None
+        self.version = None
+        self.song_serializer = None
+        self.song_pages = None
+        self.attribute_index = None
+        self.facet_index = None
+        self.feature_means = None
+        self._frame_bytes = None
+        if load:
+            self.load_and_preprocess()
 
     def load_and_preprocess(self):
+        clock = PIPELINE_STAGES.clock('catalog_load')
+        # Content hash of the CSV identifies this dataset version
+        content_hash = file_sha1(self.data_path)
+        self.version = content_hash[:16]
+        clock.lap('hash')
+        compiled = open_catalog(self.cache_dir, content_hash, self.feature_cols) if self.cache_dir else None
+        if compiled is not None:
+            # Memory-mapped from the compiled catalog: no CSV parse, no refit.
+            # An entry pruned while being read falls back to the CSV.
+            try:
+                self.df = compiled.to_dataframe()
+            except (OSError, ValueError) as e:
+                print('Error reading compiled catalog:', e)
+                compiled = None
+        if compiled is not None:
+            self.scaler = compiled.scaler
+            self.df_scaled = compiled.scaled
+            clock.lap('open_compiled')
+            self.build_indexes(normalized=compiled.normalized)
+            clock.lap('build_indexes')
+            return
+
+        self.preprocess_csv()
+        clock.lap('preprocess_csv')
+        self.build_indexes()
+        clock.lap('build_indexes')
+        if self.cache_dir and self.df.columns.is_unique:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                write_catalog(self.cache_dir, content_hash, self.df, self.feature_cols,
+                              self.scaler, self.df_scaled, self.item_index.matrix)
+                prune_cache(self.cache_dir)
+            except Exception as e:
+                print('Error writing compiled catalog:', e)
+            clock.lap('write_compiled')
+
+    def preprocess_csv(self):
         raw_df = pd.read_csv(self.data_path)
+        df = self.normalize_frame(raw_df)
+        self.fill_missing(df, {col: df[col].mean() for col in self.mean_filled_cols})
+        self.df = df
+        
+        # Create scaler and scale the features
+        self.scaler = StandardScaler()
+        feature_data = df[self.feature_cols].values
+        self.df_scaled = self.scaler.fit_transform(feature_data)
+
+    def normalize_frame(self, raw_df, start=0):
+        # Column mapping, missing columns and type coercion for the whole CSV
+        # or one chunk of it (start is the chunk's first row). Filling NaNs
+        # needs dataset-wide means, so that is left to fill_missing.
         df = raw_df.rename(columns=self.col_map)
         
         # Handle missing columns by adding default values
         for col in self.feature_cols:
             if col not in df.columns:
-                if col == 'energy':
-                    df[col] = 50  # Default energy value
-                elif col == 'danceability':
-                    df[col] = 50  # Default danceability value
-                elif col == 'loudness':
-                    df[col] = -10  # Default loudness value
-                elif col == 'liveness':
-                    df[col] = 10  # Default liveness value
-                elif col == 'valence':
-                    df[col] = 50  # Default valence value
-                elif col == 'acousticness':
-                    df[col] = 20  # Default acousticness value
-                elif col == 'speechiness':
-                    df[col] = 5   # Default speechiness value
-                elif col == 'popularity':
-                    df[col] = 50  # Default popularity value
-                else:
-                    df[col] = 0   # Default for other columns
+                df[col] = self.feature_defaults.get(col, 0)
         
-        # Convert numeric columns and handle NaN values
+        # Convert numeric columns, coercing errors to NaN
         for col in self.feature_cols:
-            if col in df.columns:
-                # Convert to numeric, coercing errors to NaN
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                # Fill NaN values with mean or default
-                if df[col].isna().any():
-                    if col in ['bpm', 'duration', 'year']:
-                        df[col] = df[col].fillna(df[col].mean())
-                    else:
-                        # For other features, use reasonable defaults
-                        defaults = {
-                            'energy': 50, 'danceability': 50, 'loudness': -10,
-                            'liveness': 10, 'valence': 50, 'acousticness': 20,
-                            'speechiness': 5, 'popularity': 50
-                        }
-                        df[col] = df[col].fillna(defaults.get(col, 0))
+            df[col] = pd.to_numeric(df[col], errors='coerce')
         
         # Ensure title column exists
         if 'title' not in df.columns and 'song_title' in raw_df.columns:
             df['title'] = raw_df['song_title']
         elif 'title' not in df.columns:
-            df['title'] = [f"Song {i+1}" for i in range(len(df))]
+            df['title'] = [f"Song {start+i+1}" for i in range(len(df))]
         
         # Ensure artist column exists
         if 'artist' not in df.columns:
@@ -88,13 +170,30 @@ class DataProcessor:
         
         df['genre'] = df['genre'].astype(str)
         df['artist'] = df['artist'].astype(str)
-        
-        self.df = df
-        
-        # Create scaler and scale the features
-        self.scaler = StandardScaler()
-        feature_data = df[self.feature_cols].values
-        self.df_scaled = self.scaler.fit_transform(feature_data)
+        return df
+
+    def fill_missing(self, df, means):
+        # Fill NaN values with the dataset mean or a reasonable default
+        for col in self.feature_cols:
+            if df[col].isna().any():
+                if col in self.mean_filled_cols:
+                    df[col] = df[col].fillna(means[col])
+                else:
+                    df[col] = df[col].fillna(self.feature_defaults.get(col, 0))
+
+    def build_indexes(self, normalized=None):
+        self.item_index = ItemIndex(self.df_scaled, normalized=normalized)
+        use_ann = self.approximate_index
+        if use_ann is None:
+            use_ann = len(self.item_index) >= ANN_MIN_ITEMS
+        self.ann_index = IVFIndex(self.item_index.matrix) if use_ann else None
+        self.neighbor_table = NeighborTable(self.item_index, path=os.path.splitext(self.data_path)[0] + '.neighbors.npz')
+        self.song_serializer = SongSerializer(self.df)
+        self.song_pages = SongPageCache(self.song_serializer, self.version)
+        self.attribute_index = AttributeIndex(self.df)
+        self.facet_index = FacetIndex(self.df, self.attribute_index)
+        # Defaults for the features the form doesn't ask about
+        self.feature_means = {col: self.df[col].mean() for col in self.feature_cols}
 
     def get_raw_df(self):
         return self.df
@@ -102,28 +201,69 @@ class DataProcessor:
     def get_scaled_df(self):
         return self.df_scaled
 
+    def get_item_index(self):
+        return self.item_index
+
+    def get_ann_index(self):
+        return self.ann_index
+
+    def get_neighbor_table(self):
+        return self.neighbor_table
+
+    def get_song_serializer(self):
+        return self.song_serializer
+
+    def get_song_pages(self):
+        return self.song_pages
+
+    def get_attribute_index(self):
+        return self.attribute_index
+
+    def get_facet_index(self):
+        return self.facet_index
+
+    def memory_usage(self):
+        # Approximate bytes held by this catalog: the raw frame (measured
+        # once, object columns are slow to size) plus the feature matrices
+        # and indexes and the rendered song pages. Memory-mapped arrays count
+        # too, being in page cache while the catalog is in use.
+        if self._frame_bytes is None:
+            self._frame_bytes = int(self.df.memory_usage(deep=True).sum())
+        arrays = [self.df_scaled, self.item_index.matrix]
+        if self.ann_index is not None:
+            arrays += [self.ann_index.centroids, self.ann_index.postings]
+        if self.neighbor_table is not None and self.neighbor_table.ids is not None:
+            arrays += [self.neighbor_table.ids, self.neighbor_table.scores]
+        for index in self.attribute_index.ranges.values():
+            arrays += [index.order, index.sorted]
+        for index in self.attribute_index.categories.values():
+            arrays += [index.order]
+        seen = set()
+        total = self._frame_bytes + self.song_pages.nbytes
+        for array in arrays:
+            if id(array) not in seen:
+                seen.add(id(array))
+                total += array.nbytes
+        return total
+
     def transform_user_input(self, user):
-        # Get default values from the dataset
-        default_values = {
-            'loudness': self.df['loudness'].mean(),
-            'liveness': self.df['liveness'].mean(),
-            'valence': self.df['valence'].mean(),
-            'acousticness': self.df['acousticness'].mean(),
-            'speechiness': self.df['speechiness'].mean(),
-            'popularity': self.df['popularity'].mean()
-        }
-        
-        user_vec = [
-            np.clip(user.get('bpmMin', 60), 60, 200),
-            user.get('energy', 50),
-            user.get('danceability', 50),
-            default_values['loudness'],
-            default_values['liveness'],
-            default_values['valence'],
-            self.df['duration'].mean(),
-            default_values['acousticness'],
-            default_values['speechiness'],
-            default_values['popularity'],
-            np.clip(user.get('yearMin', 1990), 1950, 2024)
-        ]
-        return self.scaler.transform([user_vec]) 
\ No newline at end of file
+        return self.transform_user_inputs([user])
+
+    def transform_user_inputs(self, users):
+        return self.transform_profiles([[user.get(field, default) for field, default in PROFILE_FIELDS]
+                                        for user in users])
+
+    def transform_profiles(self, profiles):
+        # Builds the raw preference matrix for many users at once from their
+        # PROFILE_FIELDS values and scales it with a single scaler.transform
+        profiles = np.asarray(profiles, dtype=np.float64).reshape(-1, len(PROFILE_FIELDS))
+        cols = {col: j for j, col in enumerate(self.feature_cols)}
+        user_mat = np.empty((len(profiles), len(self.feature_cols)))
+        # Features the form doesn't ask about default to the dataset mean
+        for col in ['loudness', 'liveness', 'valence', 'duration', 'acousticness', 'speechiness', 'popularity']:
+            user_mat[:, cols[col]] = self.feature_means[col]
+        user_mat[:, cols['bpm']] = np.clip(profiles[:, 0], 60, 200)
+        user_mat[:, cols['energy']] = profiles[:, 1]
+        user_mat[:, cols['danceability']] = profiles[:, 2]
+        user_mat[:, cols['year']] = np.clip(profiles[:, 3], 1950, 2024)
+        return self.scaler.transform(user_mat)
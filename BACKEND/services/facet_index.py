@@ -0,0 +1,74 @@
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+from services.attribute_index import normalize_label
+from services.item_index import top_k
+
+# Sorts after every character, closing the range of keys with a given prefix
+_PREFIX_END = '\U0010ffff'
+
+
+class PrefixIndex:
+    # Distinct labels sorted by their case-folded form. The labels starting
+    # with a prefix are one contiguous range found by two binary searches,
+    # and only that range is ranked by count.
+    def __init__(self, labels, keys, counts):
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.labels = [labels[i] for i in order]
+        self.counts = np.asarray(counts, dtype=np.int64)[order]
+        # Whole vocabulary by count (ties alphabetically) for empty prefixes
+        self.ranked = np.lexsort((np.arange(len(order)), -self.counts))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def top(self, limit):
+        return self._matches(self.ranked[:limit])
+
+    def complete(self, prefix, limit):
+        prefix = normalize_label(prefix)
+        if not prefix:
+            return self.top(limit)
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _PREFIX_END, lo)
+        return self._matches(lo + top_k(self.counts[lo:hi], limit))
+
+    def _matches(self, positions):
+        return [(self.labels[i], int(self.counts[i])) for i in positions]
+
+
+class FacetIndex:
+    # Song counts per distinct genre, artist and mood, built once per load
+    # from the attribute index's posting lists. Values are grouped the way
+    # filters match them (case-insensitively) and shown with the spelling of
+    # their first row.
+    def __init__(self, df, attribute_index):
+        self.fields = {}
+        for col, index in attribute_index.categories.items():
+            first_rows = index.order[index.offsets[:-1]]
+            values = df[col].to_numpy()[first_rows]
+            labels, keys, counts = [], [], []
+            for value, count in zip(values, index.counts):
+                if pd.isna(value):
+                    continue
+                key = normalize_label(value)
+                if key:
+                    labels.append(str(value).strip())
+                    keys.append(key)
+                    counts.append(count)
+            self.fields[col] = PrefixIndex(labels, keys, counts)
+
+    def distinct(self, field):
+        index = self.fields.get(field)
+        return len(index) if index is not None else 0
+
+    def top(self, field, limit):
+        # (value, count) pairs, most frequent first
+        index = self.fields.get(field)
+        return index.top(limit) if index is not None else []
+
+    def complete(self, field, prefix, limit):
+        # Values starting with prefix (case-insensitive), most frequent first
+        index = self.fields.get(field)
+        return index.complete(prefix, limit) if index is not None else []
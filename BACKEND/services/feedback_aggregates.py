@@ -0,0 +1,78 @@
+import threading
+from collections import Counter
+import numpy as np
+
+# Song ids below this are counted in dense arrays; larger ones (which the API
+# no longer accepts, but old logs may hold) go to a dict
+DENSE_MAX_SONGS = 1 << 22
+
+
+def _song_index(song_id):
+    try:
+        idx = int(song_id)
+    except (TypeError, ValueError):
+        return None
+    return idx if idx >= 0 else None
+
+
+class FeedbackAggregates:
+    # Per-song like/dislike counters indexed by song id, plus global totals.
+    # Built once from the feedback log and then updated in O(1) per event, so
+    # the admin and trending endpoints never have to re-read the log.
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self.likes = np.zeros(capacity, dtype=np.int64)
+        self.dislikes = np.zeros(capacity, dtype=np.int64)
+        self.sparse_likes = Counter()
+        self.sparse_dislikes = Counter()
+        self.total_likes = 0
+        self.total_dislikes = 0
+        self.total = 0
+
+    @classmethod
+    def from_store(cls, feedback_store):
+        aggregates = cls()
+        for entry in feedback_store.iter_entries():
+            if isinstance(entry, dict):
+                aggregates.record(entry)
+        return aggregates
+
+    def _ensure_capacity(self, idx):
+        if idx < len(self.likes):
+            return
+        size = min(max(idx + 1, 2 * len(self.likes)), DENSE_MAX_SONGS)
+        grow = size - len(self.likes)
+        self.likes = np.concatenate([self.likes, np.zeros(grow, dtype=np.int64)])
+        self.dislikes = np.concatenate([self.dislikes, np.zeros(grow, dtype=np.int64)])
+
+    def record(self, entry):
+        kind = entry.get('feedback')
+        idx = _song_index(entry.get('song_id'))
+        with self._lock:
+            if kind in ('like', 'dislike') and idx is not None:
+                if idx >= DENSE_MAX_SONGS:
+                    (self.sparse_likes if kind == 'like' else self.sparse_dislikes)[idx] += 1
+                else:
+                    self._ensure_capacity(idx)
+                    (self.likes if kind == 'like' else self.dislikes)[idx] += 1
+            self.total += 1
+            if kind == 'like':
+                self.total_likes += 1
+            elif kind == 'dislike':
+                self.total_dislikes += 1
+
+    def stats(self):
+        with self._lock:
+            return {'likes': self.total_likes, 'dislikes': self.total_dislikes, 'total': self.total}
+
+    def top_liked(self, n=10):
+        # Returns [(song_id, likes)] ordered by likes desc, then song id
+        with self._lock:
+            ids = np.flatnonzero(self.likes)
+            counts = self.likes[ids]
+            if self.sparse_likes:
+                ids = np.concatenate([ids, np.fromiter(self.sparse_likes.keys(), dtype=np.int64)])
+                counts = np.concatenate([counts, np.fromiter(self.sparse_likes.values(), dtype=np.int64)])
+        # Only songs with at least one like take part in the sort
+        order = np.lexsort((ids, -counts))[:n]
+        return [(str(int(i)), int(c)) for i, c in zip(ids[order], counts[order])]
@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+from services.append_log import AppendLog, GroupCommitWriter, write_jsonl_atomic
+
+
+def _load_legacy_feedback(legacy_path):
+    # The old format is a single JSON array rewritten on every click. It is
+    # only parsed once, when migrating into an append-only store.
+    if not legacy_path or not os.path.exists(legacy_path):
+        return []
+    try:
+        with open(legacy_path, 'r') as f:
+            data = json.load(f)
+        return data if isinstance(data, list) else []
+    except Exception as e:
+        print('Error reading legacy feedback:', e)
+        return []
+
+
+class FeedbackStore:
+    def append(self, entry, wait=True):
+        raise NotImplementedError
+
+    def iter_entries(self):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonlFeedbackStore(FeedbackStore):
+    def __init__(self, path, legacy_path=None, fsync=False):
+        self.path = path
+        if not os.path.exists(path):
+            legacy = _load_legacy_feedback(legacy_path)
+            if legacy:
+                write_jsonl_atomic(path, legacy, overwrite=False)
+        self._log = AppendLog(path, fsync=fsync)
+
+    def append(self, entry, wait=True):
+        self._log.append(entry, wait=wait)
+
+    def iter_entries(self):
+        return self._log.iter_records()
+
+    def flush(self):
+        self._log.flush()
+
+    def close(self):
+        self._log.close()
+
+
+class _SqliteWriter(GroupCommitWriter):
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._conn = None
+        super().__init__(name=f'sqlite-feedback:{os.path.basename(path)}')
+
+    def _write_batch(self, batch):
+        if self._conn is None:
+            self._conn = _connect(self.path, fsync=self.fsync)
+        with self._conn:
+            self._conn.executemany(
+                'INSERT INTO feedback (song_id, feedback, timestamp, user_preferences) VALUES (?, ?, ?, ?)',
+                batch,
+            )
+
+
+def _connect(path, fsync=False):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    # NORMAL only syncs the WAL at checkpoints; FULL syncs every commit
+    conn.execute('PRAGMA synchronous=FULL' if fsync else 'PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def _row(entry):
+    return (
+        None if entry.get('song_id') is None else str(entry.get('song_id')),
+        entry.get('feedback'),
+        entry.get('timestamp'),
+        json.dumps(entry.get('user_preferences', {}), separators=(',', ':')),
+    )
+
+
+class SqliteFeedbackStore(FeedbackStore):
+    def __init__(self, path, legacy_path=None, fsync=False):
+        self.path = path
+        is_new = not os.path.exists(path)
+        conn = _connect(path)
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS feedback ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, song_id TEXT, feedback TEXT, '
+                'timestamp INTEGER, user_preferences TEXT)'
+            )
+            if is_new:
+                legacy = _load_legacy_feedback(legacy_path)
+                conn.executemany(
+                    'INSERT INTO feedback (song_id, feedback, timestamp, user_preferences) VALUES (?, ?, ?, ?)',
+                    [_row(e) for e in legacy],
+                )
+        conn.close()
+        self._writer = _SqliteWriter(path, fsync=fsync)
+
+    def append(self, entry, wait=True):
+        self._writer._submit(_row(entry), wait=wait)
+
+    def iter_entries(self):
+        self._writer.flush()
+        conn = _connect(self.path)
+        try:
+            cursor = conn.execute('SELECT song_id, feedback, timestamp, user_preferences FROM feedback ORDER BY id')
+            for song_id, feedback, timestamp, prefs in cursor:
+                yield {
+                    'song_id': song_id,
+                    'feedback': feedback,
+                    'timestamp': timestamp,
+                    'user_preferences': json.loads(prefs) if prefs else {},
+                }
+        finally:
+            conn.close()
+
+    def flush(self):
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+
+
+def open_feedback_store(path, backend='jsonl', legacy_path=None, fsync=False):
+    if backend == 'sqlite':
+        return SqliteFeedbackStore(path, legacy_path=legacy_path, fsync=fsync)
+    if backend == 'jsonl':
+        return JsonlFeedbackStore(path, legacy_path=legacy_path, fsync=fsync)
+    raise ValueError(f'Unknown feedback backend: {backend}')
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from services.catalog_cache import CatalogWriter, open_catalog, prune_cache
+from services.data_processor import DataProcessor, file_sha1
+from services.item_index import l2_normalize
+from services.metrics import metrics
+
+# Rows per pandas chunk; peak memory of an ingest is proportional to this
+INGEST_CHUNK_ROWS = 50_000
+
+INGEST_RUNS = metrics.histogram('ingest_seconds', 'Upload compile job durations', ('status',))
+
+
+def compile_csv(csv_path, cache_dir, key, processor, chunk_rows=INGEST_CHUNK_ROWS, progress=None):
+    # Streams a CSV into the compiled catalog format without ever holding
+    # the whole dataset in memory:
+    #   1. read chunks, normalize them like DataProcessor does and append the
+    #      columns; raw features go to a scratch file, NaNs and all
+    #   2. fill NaNs with the dataset means from pass 1, in place in the
+    #      scratch file, and partial_fit the scaler over the filled features
+    #   3. transform and L2-normalize chunk by chunk into the scaled and
+    #      normalized matrices
+    progress = progress or (lambda **fields: None)
+    feature_cols = processor.feature_cols
+    n_features = len(feature_cols)
+    total_bytes = max(os.path.getsize(csv_path), 1)
+    writer = CatalogWriter(cache_dir, key, feature_cols)
+    raw_path = os.path.join(writer.directory, 'raw_features.bin')
+    try:
+        # Pass 1: parse
+        sums = np.zeros(n_features)
+        counts = np.zeros(n_features)
+        rows = 0
+        column_order = None
+        with open(csv_path, 'rb') as f, open(raw_path, 'wb') as raw:
+            for chunk in pd.read_csv(f, chunksize=chunk_rows):
+                df = processor.normalize_frame(chunk, start=rows)
+                if column_order is None:
+                    column_order = list(df.columns)
+                features = df[feature_cols].to_numpy(dtype=np.float64)
+                raw.write(features.tobytes())
+                sums += np.nansum(features, axis=0)
+                counts += (~np.isnan(features)).sum(axis=0)
+                # Feature columns are written after filling, in pass 2; other
+                # numeric columns are stored as float64 since a later chunk
+                # may hold NaNs the first one did not
+                other = df.drop(columns=feature_cols)
+                for col in other.columns:
+                    if pd.api.types.is_numeric_dtype(other[col]):
+                        other[col] = other[col].astype(np.float64)
+                writer.append_columns(other)
+                rows += len(df)
+                progress(stage='parse', rows=rows, progress=0.6 * min(f.tell() / total_bytes, 1.0))
+        if rows == 0:
+            raise ValueError('CSV has no rows')
+
+        # Pass 2: fill and fit
+        with np.errstate(invalid='ignore'):
+            means = dict(zip(feature_cols, sums / counts))
+        features = np.memmap(raw_path, dtype=np.float64, mode='r+', shape=(rows, n_features))
+        scaler = StandardScaler()
+        for start in range(0, rows, chunk_rows):
+            df = pd.DataFrame(np.array(features[start:start + chunk_rows]), columns=feature_cols)
+            processor.fill_missing(df, means)
+            block = df.to_numpy(dtype=np.float64)
+            features[start:start + len(block)] = block
+            scaler.partial_fit(block)
+            writer.append_columns(df)
+            progress(stage='fit', progress=0.6 + 0.2 * (start + len(block)) / rows)
+
+        # Pass 3: scale and normalize
+        scaled = writer.open_matrix('scaled', (rows, n_features), np.float64)
+        normalized = writer.open_matrix('normalized', (rows, n_features), np.float32)
+        for start in range(0, rows, chunk_rows):
+            block = scaler.transform(features[start:start + chunk_rows])
+            scaled[start:start + len(block)] = block
+            normalized[start:start + len(block)] = l2_normalize(block)
+            progress(stage='scale', progress=0.8 + 0.2 * (start + len(block)) / rows)
+        for matrix in (scaled, normalized):
+            matrix.flush()
+        del features, scaled, normalized
+        os.remove(raw_path)
+        writer.finish(rows, scaler, column_order=column_order)
+        return rows
+    except Exception:
+        writer.abort()
+        raise
+
+
+class IngestJobs:
+    # Runs uploads through compile_csv on a background worker and reports
+    # progress per job. When an upload has been compiled it is moved to its
+    # target path and on_done is called, so the catalog loader opens the
+    # compiled cache instead of parsing the CSV again.
+    def __init__(self, chunk_rows=INGEST_CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='csv-ingest')
+
+    def submit(self, upload_path, target_path, on_done=None):
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self.jobs[job_id] = {'id': job_id, 'status': 'queued', 'progress': 0.0, 'submitted_at': time.time()}
+        self._executor.submit(self._run, job_id, upload_path, target_path, on_done)
+        return job_id
+
+    def job(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self.jobs[job_id].update(fields)
+
+    def _run(self, job_id, upload_path, target_path, on_done):
+        started = time.time()
+        self._update(job_id, status='running', stage='hash', started_at=started)
+        try:
+            processor = DataProcessor(target_path, load=False)
+            key = file_sha1(upload_path)
+            compiled = open_catalog(processor.cache_dir, key, processor.feature_cols)
+            if compiled is not None:
+                # Same content was compiled before
+                rows = compiled.manifest['rows']
+            else:
+                rows = compile_csv(upload_path, processor.cache_dir, key, processor, self.chunk_rows,
+                                   progress=lambda **fields: self._update(job_id, **fields))
+                prune_cache(processor.cache_dir)
+            os.replace(upload_path, target_path)
+            if on_done:
+                on_done()
+            self._update(job_id, status='done', stage='done', progress=1.0, rows=rows,
+                         finished_at=time.time(), duration=time.time() - started)
+            INGEST_RUNS.labels('done').observe(time.time() - started)
+        except Exception as e:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+            self._update(job_id, status='failed', error=str(e), finished_at=time.time())
+            INGEST_RUNS.labels('failed').observe(time.time() - started)
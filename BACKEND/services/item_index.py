@@ -0,0 +1,90 @@
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+# Catalogs at least this large get an approximate (IVF) index by default
+ANN_MIN_ITEMS = 100_000
+# Row subsets larger than this fraction of the catalog are scored with a full
+# matrix-vector product and gathered, which beats copying the rows out
+DENSE_ROWS_FRACTION = 0.25
+
+
+def l2_normalize(matrix):
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    # Zero rows stay zero, matching sklearn's cosine_similarity
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)
+
+
+def top_k(scores, k):
+    # Indices of the k largest scores, best first. Ties are broken by index so
+    # the result does not depend on how argpartition happened to split them.
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        kth = np.partition(scores, n - k)[n - k]
+        # Only the lowest-index ties at the kth score can make the cut, so a
+        # flat array (e.g. all-zero collaborative scores) stays O(n)
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))[:k]
+    return candidates[order]
+
+
+class ItemIndex:
+    # Exact cosine index: rows are L2-normalized once per dataset load, so a
+    # query is a single matrix-vector product against a contiguous float32
+    # matrix instead of a full cosine_similarity pass.
+    def __init__(self, scaled_matrix, normalized=None):
+        # normalized may be passed in precomputed, e.g. memory-mapped from disk
+        self.matrix = l2_normalize(scaled_matrix) if normalized is None else normalized
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def normalize_query(self, vec):
+        return l2_normalize(np.asarray(vec).reshape(-1))
+
+    def scores(self, query_vec, rows=None):
+        q = self.normalize_query(query_vec)
+        if rows is None:
+            return self.matrix @ q
+        if len(rows) > DENSE_ROWS_FRACTION * len(self):
+            return (self.matrix @ q)[rows]
+        return self.matrix[rows] @ q
+
+
+class IVFIndex:
+    # Approximate index: k-means partitions the normalized rows into inverted
+    # lists and a query only visits the lists whose centroids are closest to
+    # it. Returns candidate rows; scoring them is left to ItemIndex.
+    def __init__(self, normalized_matrix, n_lists=None, nprobe=None, sample_size=100_000, random_state=0):
+        n = normalized_matrix.shape[0]
+        self.n_lists = n_lists or max(1, int(np.sqrt(n)))
+        self.nprobe = nprobe or max(1, self.n_lists // 16)
+        rng = np.random.default_rng(random_state)
+        sample = normalized_matrix
+        if n > sample_size:
+            sample = normalized_matrix[np.sort(rng.choice(n, sample_size, replace=False))]
+        kmeans = MiniBatchKMeans(n_clusters=self.n_lists, n_init=3, random_state=random_state)
+        kmeans.fit(sample)
+        self.centroids = l2_normalize(kmeans.cluster_centers_)
+
+        labels = np.empty(n, dtype=np.int32)
+        chunk = 65536
+        for start in range(0, n, chunk):
+            labels[start:start + chunk] = np.argmax(normalized_matrix[start:start + chunk] @ self.centroids.T, axis=1)
+        self.postings = np.argsort(labels, kind='stable').astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=self.n_lists))])
+
+    def candidates(self, query_vec, nprobe=None):
+        q = l2_normalize(np.asarray(query_vec).reshape(-1))
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        lists = top_k(self.centroids @ q, nprobe)
+        rows = [self.postings[self.offsets[i]:self.offsets[i + 1]] for i in lists]
+        return np.sort(np.concatenate(rows))
@@ -0,0 +1,190 @@
+import bisect
+import threading
+import time
+
+# Bucket upper bounds in seconds, from 50us (a cache hit) to a minute (a
+# large catalog load)
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    # Fixed-bucket latency histogram for one label set. An observation is a
+    # bisect plus two additions under a lock, cheap enough to leave on.
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def time(self):
+        return _Timer(self)
+
+    def quantile(self, q, counts=None, count=None):
+        # Linear interpolation inside the bucket holding the q-th observation,
+        # as Prometheus' histogram_quantile does
+        counts = self.counts if counts is None else counts
+        count = self.count if count is None else count
+        if count == 0:
+            return None
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            if seen + n >= rank and n > 0:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        return {
+            'count': count,
+            'sum_s': total,
+            'mean_ms': total / count * 1000 if count else None,
+            'p50_ms': _ms(self.quantile(0.5, counts, count)),
+            'p95_ms': _ms(self.quantile(0.95, counts, count)),
+            'p99_ms': _ms(self.quantile(0.99, counts, count)),
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class StageClock:
+    # Times consecutive stages of one pipeline run: each lap(stage) records
+    # the time since the previous lap (or since the clock was made)
+    __slots__ = ('family', 'prefix', 'last')
+
+    def __init__(self, family, prefix):
+        self.family = family
+        self.prefix = prefix
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.family.labels(*self.prefix, stage).observe(now - self.last)
+        self.last = now
+
+
+class HistogramFamily:
+    # A named histogram with one child per combination of label values
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(values, Histogram(self.buckets))
+        return child
+
+    def clock(self, *prefix):
+        return StageClock(self, prefix)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            if name not in self.families:
+                self.families[name] = HistogramFamily(name, help_text, label_names, buckets)
+            return self.families[name]
+
+    def register_gauges(self, prefix, help_text, callback):
+        # callback() returns a dict; its numeric values are exported as
+        # <prefix>_<key> gauges, read at scrape time
+        with self._lock:
+            self.gauges[prefix] = (help_text, callback)
+
+    def _gauge_values(self):
+        values = {}
+        for prefix, (help_text, callback) in list(self.gauges.items()):
+            try:
+                stats = callback() or {}
+            except Exception as e:
+                print('Error reading gauges:', prefix, e)
+                continue
+            values[prefix] = (help_text, {k: v for k, v in stats.items()
+                                          if isinstance(v, (int, float)) and not isinstance(v, bool)})
+        return values
+
+    def to_json(self):
+        histograms = {}
+        for name, family in list(self.families.items()):
+            histograms[name] = [dict(zip(family.label_names, values), **child.snapshot())
+                                for values, child in sorted(family.children.items())]
+        gauges = {prefix: stats for prefix, (_, stats) in self._gauge_values().items()}
+        return {'histograms': histograms, 'gauges': gauges}
+
+    def to_prometheus(self):
+        lines = []
+        for name, family in list(self.families.items()):
+            lines.append(f'# HELP {name} {family.help}')
+            lines.append(f'# TYPE {name} histogram')
+            for values, child in sorted(family.children.items()):
+                with child._lock:
+                    counts, count, total = list(child.counts), child.count, child.sum
+                labels = [f'{k}="{_escape(v)}"' for k, v in zip(family.label_names, values)]
+                cumulative = 0
+                for bound, n in zip(list(family.buckets) + ['+Inf'], counts):
+                    cumulative += n
+                    le = bound if bound == '+Inf' else repr(float(bound))
+                    bucket_labels = ','.join(labels + ['le="%s"' % le])
+                    lines.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+                suffix = '{' + ','.join(labels) + '}' if labels else ''
+                lines.append(f'{name}_sum{suffix} {total}')
+                lines.append(f'{name}_count{suffix} {count}')
+        for prefix, (help_text, stats) in self._gauge_values().items():
+            for key, value in stats.items():
+                lines.append(f'# HELP {prefix}_{key} {help_text}')
+                lines.append(f'# TYPE {prefix}_{key} gauge')
+                lines.append(f'{prefix}_{key} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Process-wide registry; services record into it and /api/admin/metrics
+# renders it
+metrics = MetricsRegistry()
+
+PIPELINE_STAGES = metrics.histogram('pipeline_stage_seconds', 'Time spent per pipeline stage',
+                                    ('pipeline', 'stage'))
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import threading
+import uuid
+import numpy as np
+from services.item_index import top_k
+
+# Neighbors kept per song; /api/similar-songs serves a prefix of these
+NEIGHBOR_K = 20
+# Upper bound on the (block rows x songs) similarity block held in memory
+BLOCK_BUDGET = 16 * 1024 * 1024
+# The build is quadratic in the catalog size; larger catalogs serve every
+# lookup from the matrix-vector fallback instead
+NEIGHBOR_TABLE_MAX_ITEMS = 200_000
+
+
+def matrix_signature(matrix, k=NEIGHBOR_K):
+    h = hashlib.sha1()
+    h.update(str((matrix.shape, str(matrix.dtype), k)).encode())
+    h.update(np.ascontiguousarray(matrix).tobytes())
+    return h.hexdigest()
+
+
+def build_neighbor_table(normalized, k=NEIGHBOR_K):
+    # Blocked all-pairs cosine: each block of rows is multiplied against the
+    # whole catalog, reduced to its top k and discarded, so memory stays
+    # bounded by BLOCK_BUDGET whatever the catalog size.
+    n = normalized.shape[0]
+    k = max(0, min(k, n - 1))
+    ids = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float16)
+    if k == 0:
+        return ids, scores
+    block = max(1, BLOCK_BUDGET // n)
+    for start in range(0, n, block):
+        end = min(start + block, n)
+        sims = normalized[start:end] @ normalized.T
+        rows = np.arange(end - start)
+        # A song is not its own neighbor
+        sims[rows, start + rows] = -np.inf
+        part = np.sort(np.argpartition(-sims, k - 1, axis=1)[:, :k], axis=1)
+        part_scores = np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind='stable')
+        ids[start:end] = np.take_along_axis(part, order, axis=1)
+        scores[start:end] = np.take_along_axis(part_scores, order, axis=1)
+    return ids, scores
+
+
+class NeighborTable:
+    # Top-K item-to-item neighbors per song as compact int32/float16 arrays,
+    # persisted next to the CSV. When the catalog has changed the table is
+    # rebuilt in a background thread; lookups fall back to a single
+    # matrix-vector product until it is ready.
+    def __init__(self, item_index, path=None, k=NEIGHBOR_K, max_items=NEIGHBOR_TABLE_MAX_ITEMS):
+        self.item_index = item_index
+        self.path = path
+        self.k = k
+        self.ids = None
+        self.scores = None
+        self._ready = threading.Event()
+        self.enabled = max_items is None or len(item_index) <= max_items
+        if not self.enabled:
+            self.signature = None
+            return
+        self.signature = matrix_signature(item_index.matrix, k)
+        if self._load():
+            self._ready.set()
+        else:
+            threading.Thread(target=self._build, name='neighbor-table-build', daemon=True).start()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path) as data:
+                if str(data['signature']) != self.signature:
+                    return False
+                self.ids = data['ids']
+                self.scores = data['scores']
+            return True
+        except Exception as e:
+            print('Error loading neighbor table:', e)
+            return False
+
+    def _build(self):
+        try:
+            ids, scores = build_neighbor_table(self.item_index.matrix, self.k)
+            self.ids, self.scores = ids, scores
+            self._ready.set()
+            if self.path:
+                # Private to this process, since workers started together
+                # build the same table
+                tmp_path = f'{self.path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+                try:
+                    with open(tmp_path, 'wb') as f:
+                        np.savez(f, ids=ids, scores=scores, signature=np.array(self.signature))
+                    os.replace(tmp_path, self.path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+        except Exception as e:
+            print('Error building neighbor table:', e)
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        # False straight away when the table is never going to be built
+        return self.enabled and self._ready.wait(timeout)
+
+    def neighbors(self, idx, n=10):
+        if self._ready.is_set() and n <= self.ids.shape[1]:
+            return self.ids[idx, :n].astype(np.int64), self.scores[idx, :n].astype(np.float32)
+        matrix = self.item_index.matrix
+        sims = matrix @ matrix[idx]
+        sims[idx] = -np.inf
+        top = top_k(sims, min(n, len(sims) - 1))
+        return top, sims[top]
@@ -1,94 +1,191 @@
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import os
-import json
+from services.item_index import l2_normalize, top_k
+from services.song_serializer import round_scores
+from services.collaborative import preference_key
+from services.attribute_index import category_key
+from services.metrics import PIPELINE_STAGES
+
+# Upper bound on the (users x songs) score block held in memory by recommend_many
+BATCH_SCORE_BUDGET = 32 * 1024 * 1024
+
+# Songs from the collaborative model always considered by the approximate path
+COLLAB_CANDIDATES = 50
+
+# Scaled preference vectors are rounded to this many decimals for cache keys
+CACHE_KEY_DECIMALS = 6
+
+# Filtered candidate sets up to this size are scored exactly even when an
+# approximate index exists
+FILTER_EXACT_MAX = 50_000
 
 class RecommendationSystem:
-    def __init__(self, data_processor, feedback_path=None):
+    def __init__(self, data_processor, collaborative=None, result_cache=None, scorer=None):
         self.data_processor = data_processor
-        self.feedback_path = feedback_path
-        self.pseudo_user_profiles = None
-        self._load_feedback_and_build_profiles()
-
-    def _load_feedback_and_build_profiles(self):
-        # Load feedback and build pseudo-user profiles for collaborative filtering
-        if self.feedback_path and os.path.exists(self.feedback_path):
-            with open(self.feedback_path, 'r') as f:
-                feedback_data = json.load(f)
-            # Group feedback by user_preferences (simulate pseudo-users)
-            profiles = {}
-            for entry in feedback_data:
-                prefs = tuple(sorted(entry.get('user_preferences', {}).items()))
-                if prefs not in profiles:
-                    profiles[prefs] = {'likes': [], 'dislikes': []}
-                if entry['feedback'] == 'like':
-                    profiles[prefs]['likes'].append(entry['song_id'])
-                elif entry['feedback'] == 'dislike':
-                    profiles[prefs]['dislikes'].append(entry['song_id'])
-            self.pseudo_user_profiles = profiles
-        else:
-            self.pseudo_user_profiles = {}
+        # CollaborativeTrainer shared across dataset reloads; its model is
+        # swapped in the background, so it is read once per request
+        self.collaborative = collaborative
+        # Optional ResultCache, also shared across reloads: keys carry the
+        # catalog and model versions, so a reload or retrain never serves
+        # stale results
+        self.result_cache = result_cache
+        # Optional ShardedScorer: large candidate sets are scored exactly on
+        # its workers, taking the place of the approximate index
+        self.scorer = scorer
+        self._profile_vectors = (None, None, None)
 
     def recommend(self, user_input, top_n=10):
-        # Content-based
+        clock = PIPELINE_STAGES.clock('recommend')
         user_vec = self.data_processor.transform_user_input(user_input)
-        df_scaled = self.data_processor.get_scaled_df()
-        df = self.data_processor.get_raw_df()
-        sim = cosine_similarity(user_vec, df_scaled)[0]
-        content_scores = sim / sim.max() if sim.max() > 0 else sim
+        clock.lap('transform_user_input')
+        model = self.collaborative.model if self.collaborative is not None else None
+        user_row = self._collab_row(model, user_input, user_vec[0])
+        clock.lap('profile_match')
+        constraints = self.data_processor.get_attribute_index().constraints(user_input)
+        if self.result_cache is None:
+            return self._recommend(user_vec[0], model, user_row, constraints, top_n)
+        key = (self.data_processor.version, model.version if model is not None else None, user_row,
+               np.round(user_vec[0], CACHE_KEY_DECIMALS).tobytes(), constraints, top_n)
+        return self.result_cache.get(key, lambda: self._recommend(user_vec[0], model, user_row, constraints, top_n))
+
+    def _filter_mask(self, constraints):
+        # Candidate bitmap from the attribute indexes. When nothing matches,
+        # the whole catalog is ranked rather than returning no songs.
+        mask = self.data_processor.get_attribute_index().mask(constraints)
+        if mask is not None and not mask.any():
+            return None
+        return mask
+
+    def _recommend(self, user_vec, model, user_row, constraints, top_n):
+        clock = PIPELINE_STAGES.clock('recommend')
+        # Content-based
+        index = self.data_processor.get_item_index()
+        ann_index = self.data_processor.get_ann_index()
+        collab_scores = self._item_scores(model, user_row, len(index))
+        clock.lap('collab_scores')
 
-        # Collaborative filtering (synthetic)
-        collab_scores = np.zeros(len(df))
-        if self.pseudo_user_profiles:
-            # Find closest pseudo-user profile
-            input_prefs = tuple(sorted(user_input.items()))
-            best_profile = None
-            best_match = 0
-            for prefs, feedback in self.pseudo_user_profiles.items():
-                match = len(set(dict(prefs).keys()) & set(user_input.keys()))
-                if match > best_match:
-                    best_match = match
-                    best_profile = feedback
-            if best_profile and best_profile['likes']:
-                liked_indices = [int(sid) for sid in best_profile['likes'] if str(sid).isdigit() and int(sid) < len(df)]
-                collab_scores[liked_indices] = 1.0
-        # Blend scores
+        # Filters are pushed down: only rows matching every constraint are
+        # scored
+        mask = self._filter_mask(constraints)
+        rows = None if mask is None else np.flatnonzero(mask)
+        clock.lap('filter')
+
+        if self.scorer is not None and self.scorer.covers(len(index), rows):
+            top_idx, top_scores = self.scorer.rank(index.matrix, index.normalize_query(user_vec),
+                                                   collab_scores, top_n, rows)
+            clock.lap('sharded_score')
+            return self._records(top_idx, top_scores, clock)
+
+        # With an approximate index only the probed lists (plus the songs the
+        # collaborative half would boost most) are scored, restricted to the
+        # filter; small filtered sets are scored exactly instead
+        if ann_index is not None and (rows is None or len(rows) > FILTER_EXACT_MAX):
+            boosted = top_k(collab_scores, COLLAB_CANDIDATES)
+            boosted = boosted[collab_scores[boosted] > 0]
+            candidates = ann_index.candidates(user_vec)
+            if len(boosted):
+                candidates = np.union1d(candidates, boosted)
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            if rows is None or len(candidates) >= top_n:
+                rows = candidates
+            clock.lap('ann_candidates')
+        if rows is not None:
+            collab_scores = collab_scores[rows]
+        sim = index.scores(user_vec, rows)
+        clock.lap('similarity')
+        return self._rank(sim, collab_scores, top_n, rows, clock)
+
+    def recommend_many(self, user_inputs, top_n=10):
+        return list(self.iter_recommend_many(user_inputs, top_n))
+
+    def iter_recommend_many(self, user_inputs, top_n=10):
+        # Scores a block of users with one GEMM against the item index and
+        # yields each user's results in input order
+        if not user_inputs:
+            return
+        clock = PIPELINE_STAGES.clock('recommend_batch')
+        index = self.data_processor.get_item_index()
+        n_items = len(index)
+        raw_mat = self.data_processor.transform_user_inputs(user_inputs)
+        user_mat = l2_normalize(raw_mat)
+        clock.lap('transform_user_input')
+        block = max(1, BATCH_SCORE_BUDGET // max(n_items, 1))
+        for start in range(0, len(user_inputs), block):
+            # Laps restart here: time spent by the consumer between yields is
+            # not part of any stage
+            clock = PIPELINE_STAGES.clock('recommend_batch')
+            sims = user_mat[start:start + block] @ index.matrix.T
+            clock.lap('similarity')
+            model = self.collaborative.model if self.collaborative is not None else None
+            attribute_index = self.data_processor.get_attribute_index()
+            for i, sim in enumerate(sims, start):
+                clock = PIPELINE_STAGES.clock('recommend_batch')
+                user_row = self._collab_row(model, user_inputs[i], raw_mat[i])
+                collab_scores = self._item_scores(model, user_row, n_items)
+                clock.lap('collab_scores')
+                mask = self._filter_mask(attribute_index.constraints(user_inputs[i]))
+                rows = None
+                if mask is not None:
+                    rows = np.flatnonzero(mask)
+                    sim, collab_scores = sim[rows], collab_scores[rows]
+                clock.lap('filter')
+                yield self._rank(sim, collab_scores, top_n, rows, clock)
+
+    def _rank(self, sim, collab_scores, top_n, rows=None, clock=None):
+        # Blends content similarity with the collaborative scores over either
+        # the whole catalog or the given candidate rows
+        content_scores = sim / sim.max() if sim.max() > 0 else sim
         blend = 0.7 * content_scores + 0.3 * collab_scores
-        top_idx = np.argsort(blend)[::-1][:top_n]
-        results = [self.song_to_dict(df.iloc[i], i, blend[i]) for i in top_idx]
-        return results
-
-    def song_to_dict(self, row, idx, score=None):
-        # Handle missing columns gracefully
-        title = row.get('title', row.get('song_title', f"Song {idx}"))
-        artist = row.get('artist', 'Unknown Artist')
-        genre = row.get('genre', 'Unknown Genre')
-        year = int(row.get('year', 2020))
-        bpm = int(row.get('bpm', 120))
-        energy = int(row.get('energy', 50))
-        danceability = int(row.get('danceability', 50))
-        duration = row.get('duration', 180)
-        
-        # Convert duration to MM:SS format
-        if isinstance(duration, (int, float)):
-            duration_str = f"{int(duration//60)}:{int(duration%60):02d}"
-        else:
-            duration_str = str(duration)
-        
-        d = {
-            'id': str(row.name if hasattr(row, 'name') else idx),
-            'title': title,
-            'artist': artist,
-            'genre': genre,
-            'year': year,
-            'bpm': bpm,
-            'energy': energy,
-            'danceability': danceability,
-            'duration': duration_str
-        }
-        if score is not None:
-            d['score'] = float(f'{score:.3f}')
-        return d
+        top = top_k(blend, top_n)
+        top_idx = top if rows is None else rows[top]
+        if clock:
+            clock.lap('rank')
+        return self._records(top_idx, blend[top], clock)
+
+    def _records(self, top_idx, scores, clock=None):
+        serializer = self.data_processor.get_song_serializer()
+        records = serializer.records(top_idx, extra={'score': round_scores(scores)})
+        if clock:
+            clock.lap('serialize')
+        return records
+
+    def _collab_row(self, model, user_input, user_vec):
+        # Row of the ALS pseudo-user that speaks for this request. A user whose
+        # exact preferences gave feedback uses their own factors; anyone else
+        # borrows, among the pseudo-users who chose the same genre, artist and
+        # mood, the one whose scaled preference vector is closest. With no
+        # such pseudo-user, or several equally close, there is no
+        # collaborative term rather than an arbitrary one.
+        if model is None or not model.user_prefs:
+            return None
+        user_row = model.user_index.get(preference_key(user_input))
+        if user_row is not None:
+            return user_row
+        # The profiles were validated at train time; only the scaling is per
+        # catalog, done once per model version
+        version, vectors, groups = self._profile_vectors
+        if version != model.version:
+            vectors = self.data_processor.transform_profiles(model.profiles)
+            groups = {}
+            for row, prefs in enumerate(model.user_prefs):
+                groups.setdefault(category_key(prefs), []).append(row)
+            groups = {key: np.array(rows) for key, rows in groups.items()}
+            self._profile_vectors = (model.version, vectors, groups)
+        rows = groups.get(category_key(user_input))
+        if rows is None:
+            return None
+        distances = np.nan_to_num(((vectors[rows] - user_vec) ** 2).sum(axis=1), nan=np.inf)
+        best = int(np.argmin(distances))
+        if not np.isfinite(distances[best]) or np.count_nonzero(distances == distances[best]) > 1:
+            return None
+        return int(rows[best])
+
+    def _item_scores(self, model, user_row, n_items):
+        # Implicit-feedback ALS scores in [0, 1]
+        if user_row is None:
+            return np.zeros(n_items, dtype=np.float32)
+        return model.item_scores(user_row, n_items)
 
     def retrain(self):
-        self._load_feedback_and_build_profiles() 
\ No newline at end of file
+        # Returns the id of the background training job
+        return self.collaborative.submit()
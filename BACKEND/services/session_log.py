@@ -0,0 +1,164 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from services.append_log import GroupCommitWriter, iter_jsonl, write_jsonl_atomic
+
+# A segment is closed and a new one started once it reaches this size
+SESSION_SEGMENT_BYTES = 4 * 1024 * 1024
+# Closed segments kept; older ones are deleted on rotation
+SESSION_MAX_SEGMENTS = 16
+# Seconds between age checks while sessions keep arriving; segments can
+# expire without a rotation
+SESSION_PRUNE_INTERVAL = 3600
+# Most recent sessions kept in memory for the admin dashboard
+SESSION_RING_SIZE = 200
+
+_SEGMENT_RE = re.compile(r'^sessions-(\d+)\.jsonl$')
+_TAIL_BLOCK = 64 * 1024
+
+
+def _load_legacy_sessions(legacy_path):
+    # user_sessions.json used to be one JSON array rewritten per request
+    if not legacy_path or not os.path.exists(legacy_path):
+        return []
+    try:
+        with open(legacy_path, 'r') as f:
+            data = json.load(f)
+        return data if isinstance(data, list) else []
+    except Exception as e:
+        print('Error reading legacy sessions:', e)
+        return []
+
+
+def tail_jsonl(path, n):
+    # Last n records of a JSON-lines file, read backwards in blocks so the
+    # cost depends on n, not on the size of the file
+    if n <= 0 or not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b''
+        while end > 0 and data.count(b'\n') <= n:
+            start = max(0, end - _TAIL_BLOCK)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    records = []
+    for line in data.splitlines()[::-1]:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # Torn line from a crash mid-write, or the partial first line of
+            # the block
+            continue
+        if len(records) == n:
+            break
+    return records[::-1]
+
+
+class SessionLog(GroupCommitWriter):
+    # Append-only session history split into numbered JSONL segments
+    # (sessions-000001.jsonl, ...). Appends are queued to the background
+    # writer and never block the request; the segment rotates at
+    # segment_bytes and segments beyond max_segments, or older than max_age
+    # seconds, are deleted on rotation, at startup and every prune_interval
+    # seconds of writes. recent() is answered from an in-memory ring of
+    # the newest sessions, falling back to reading segment tails.
+    def __init__(self, directory, segment_bytes=SESSION_SEGMENT_BYTES, max_segments=SESSION_MAX_SEGMENTS,
+                 max_age=None, ring_size=SESSION_RING_SIZE, legacy_path=None,
+                 prune_interval=SESSION_PRUNE_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        os.makedirs(directory, exist_ok=True)
+        if not self.segments():
+            legacy = _load_legacy_sessions(legacy_path)
+            if legacy:
+                write_jsonl_atomic(self._segment_path(1), legacy, overwrite=False)
+        segments = self.segments()
+        self._seq = segments[-1][0] if segments else 1
+        self._prune()
+        self._file = None
+        self._ring = deque(self.tail(ring_size), maxlen=ring_size)
+        self._ring_lock = threading.Lock()
+        super().__init__(name='session-log')
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f'sessions-{seq:06d}.jsonl')
+
+    def segments(self):
+        # (sequence number, path) pairs, oldest first
+        found = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_RE.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def append(self, session):
+        with self._ring_lock:
+            self._ring.append(session)
+        return self._submit(json.dumps(session, separators=(',', ':')) + '\n')
+
+    def _write_batch(self, batch):
+        if self._file is None:
+            self._file = open(self._segment_path(self._seq), 'a', encoding='utf-8')
+        self._file.write(''.join(batch))
+        self._file.flush()
+        if self._file.tell() >= self.segment_bytes:
+            self._file.close()
+            self._file = None
+            self._seq += 1
+            self._prune()
+        elif self.max_age is not None and time.time() - self._pruned_at >= self.prune_interval:
+            self._prune()
+
+    def _prune(self):
+        self._pruned_at = time.time()
+        closed = [(seq, path) for seq, path in self.segments() if seq < self._seq]
+        expired = closed[:max(0, len(closed) - self.max_segments)]
+        if self.max_age is not None:
+            cutoff = time.time() - self.max_age
+            expired += [(seq, path) for seq, path in closed[len(expired):] if os.path.getmtime(path) < cutoff]
+        for _, path in expired:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print('Error removing session segment:', e)
+
+    def recent(self, n):
+        with self._ring_lock:
+            if n <= len(self._ring) or len(self._ring) < self._ring.maxlen:
+                return list(self._ring)[-n:] if n > 0 else []
+        self.flush()
+        return self.tail(n)
+
+    def tail(self, n):
+        # Newest n sessions across segments, oldest first
+        records = []
+        for _, path in reversed(self.segments()):
+            records = tail_jsonl(path, n - len(records)) + records
+            if len(records) >= n:
+                break
+        return records
+
+    def iter_sessions(self):
+        # Full retained history, oldest first
+        self.flush()
+        for _, path in self.segments():
+            yield from iter_jsonl(path)
+
+    def close(self):
+        super().close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
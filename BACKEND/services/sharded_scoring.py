@@ -0,0 +1,202 @@
+import multiprocessing
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from services.item_index import DENSE_ROWS_FRACTION, top_k
+
+# Rows per shard; rounded up to a multiple of SHARD_ALIGN so shard boundaries
+# fall on the same BLAS row blocks as one product over the whole matrix
+SHARD_ROWS = 65_536
+SHARD_ALIGN = 64
+# Candidate sets smaller than this are scored on the request thread
+SHARDED_MIN_ROWS = 100_000
+# Item matrices a process worker keeps attached
+_WORKER_MATRICES = 4
+
+
+def _score_shard(matrix, out, start, end, query, rows):
+    # Similarities of one shard into out[start:end]; returns the largest one
+    # among rows (catalog rows inside the shard, or None for all of them)
+    sim = out[start:end]
+    np.matmul(matrix[start:end], query, out=sim)
+    if rows is not None:
+        sim = out[rows]
+    return sim.max() if len(sim) else None
+
+
+def _rank_shard(out, collab_scores, start, end, rows, scale, k):
+    # RecommendationSystem._rank restricted to one shard: the same blend,
+    # then the shard's own top k as (catalog rows, blended scores)
+    sim = out[start:end] if rows is None else out[rows]
+    collab = collab_scores[start:end] if rows is None else collab_scores[rows]
+    content_scores = sim / scale if scale > 0 else sim
+    blend = 0.7 * content_scores + 0.3 * collab
+    top = top_k(blend, k)
+    return (start + top if rows is None else rows[top]), blend[top]
+
+
+# Process workers: the item matrix and each request's buffers live in shared
+# memory and are attached by name
+_attached = OrderedDict()
+
+
+def _attach_matrix(name, shape):
+    if name not in _attached:
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = (shm, np.ndarray(shape, dtype=np.float32, buffer=shm.buf))
+        while len(_attached) > _WORKER_MATRICES:
+            old, array = _attached.popitem(last=False)[1]
+            del array
+            try:
+                old.close()
+            except BufferError:
+                pass
+    _attached.move_to_end(name)
+    return _attached[name][1]
+
+
+def _with_buffer(name, n, fn, *args):
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        buffers = np.ndarray((2, n), dtype=np.float32, buffer=shm.buf)
+        result = fn(buffers, *args)
+        del buffers
+        return result
+    finally:
+        shm.close()
+
+
+def _score_shared(matrix_name, shape, buffer_name, start, end, query, rows):
+    matrix = _attach_matrix(matrix_name, shape)
+    return _with_buffer(buffer_name, shape[0],
+                        lambda buffers: _score_shard(matrix, buffers[0], start, end, query, rows))
+
+
+def _rank_shared(buffer_name, n, start, end, rows, scale, k):
+    def rank(buffers):
+        idx, scores = _rank_shard(buffers[0], buffers[1], start, end, rows, scale, k)
+        return idx.copy(), scores.copy()
+    return _with_buffer(buffer_name, n, rank)
+
+
+def _ready(_):
+    return os.getpid()
+
+
+class SharedMatrix:
+    # Copy of an item matrix in shared memory, unlinked with the original
+    def __init__(self, matrix):
+        self.shape = matrix.shape
+        self.shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)[:] = matrix
+        self._finalizer = weakref.finalize(matrix, SharedMatrix._release, self.shm)
+
+    @staticmethod
+    def _release(shm):
+        shm.close()
+        shm.unlink()
+
+
+class ShardedScorer:
+    # Exact scoring for large catalogs spread over several cores. The item
+    # matrix is split into contiguous shards of shard_rows; each worker scores
+    # its shard and keeps its own top k, and the per-shard winners are merged.
+    # Content scores are normalized by the best similarity over the whole
+    # candidate set, so this runs in two rounds: similarities and their
+    # maximum, then blend and top k. Ties are broken by lower row, as top_k
+    # does, so the result is identical to ranking in one piece.
+    #
+    # executor='thread' shares the matrix directly; matmul releases the GIL,
+    # so shards run in parallel. executor='process' copies each catalog's
+    # matrix into shared memory once and forks its workers up front, so the
+    # scorer should be created before the app starts background threads.
+    def __init__(self, workers=None, shard_rows=SHARD_ROWS, min_rows=SHARDED_MIN_ROWS, executor='thread'):
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_rows = -(-max(shard_rows, 1) // SHARD_ALIGN) * SHARD_ALIGN
+        self.min_rows = min_rows
+        self.executor = executor
+        if executor == 'process':
+            # Workers share this process's tracker, which unlinks the shared
+            # blocks only if the app dies without doing it itself
+            resource_tracker.ensure_running()
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+            list(self._pool.map(_ready, range(self.workers)))
+        elif executor == 'thread':
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='scoring')
+        else:
+            raise ValueError(f'Unknown executor: {executor}')
+        self._shared = {}
+        self._lock = threading.Lock()
+
+    def covers(self, n_items, rows=None):
+        # Whole catalogs and dense filters (the same cut-over ItemIndex.scores
+        # uses) of at least min_rows candidates; anything else is cheaper on
+        # the request thread
+        if rows is None:
+            return n_items >= self.min_rows
+        return len(rows) >= self.min_rows and len(rows) > DENSE_ROWS_FRACTION * n_items
+
+    def shards(self, n_items, rows=None):
+        # (start, end, rows in [start, end) or None) for every shard with at
+        # least one candidate
+        bounds = [(start, min(start + self.shard_rows, n_items)) for start in range(0, n_items, self.shard_rows)]
+        if rows is None:
+            return [(start, end, None) for start, end in bounds]
+        cuts = np.searchsorted(rows, [start for start, _ in bounds] + [n_items])
+        return [(start, end, rows[lo:hi]) for (start, end), lo, hi in zip(bounds, cuts[:-1], cuts[1:]) if hi > lo]
+
+    def rank(self, matrix, query, collab_scores, top_n, rows=None):
+        # Catalog rows of the top_n blended scores, best first, with their
+        # scores. query is L2-normalized; rows, if given, is sorted.
+        n_items = matrix.shape[0]
+        query = np.asarray(query, dtype=np.float32)
+        shards = self.shards(n_items, rows)
+        if self.executor == 'process':
+            return self._rank_processes(matrix, query, collab_scores, top_n, shards)
+        out = np.empty(n_items, dtype=np.float32)
+        maxima = list(self._pool.map(lambda s: _score_shard(matrix, out, s[0], s[1], query, s[2]), shards))
+        scale = max(maxima)
+        ranked = self._pool.map(lambda s: _rank_shard(out, collab_scores, s[0], s[1], s[2], scale, top_n), shards)
+        return self._merge(list(ranked), top_n)
+
+    def _rank_processes(self, matrix, query, collab_scores, top_n, shards):
+        shared = self._shared_matrix(matrix)
+        n_items = matrix.shape[0]
+        # Similarities and collaborative scores for this request, side by side
+        shm = shared_memory.SharedMemory(create=True, size=max(2 * n_items * 4, 1))
+        try:
+            buffers = np.ndarray((2, n_items), dtype=np.float32, buffer=shm.buf)
+            buffers[1] = collab_scores
+            del buffers
+            maxima = list(self._pool.map(_score_shared, *zip(*[
+                (shared.shm.name, shared.shape, shm.name, start, end, query, rows) for start, end, rows in shards])))
+            scale = max(maxima)
+            ranked = list(self._pool.map(_rank_shared, *zip(*[
+                (shm.name, n_items, start, end, rows, scale, top_n) for start, end, rows in shards])))
+        finally:
+            shm.close()
+            shm.unlink()
+        return self._merge(ranked, top_n)
+
+    def _shared_matrix(self, matrix):
+        with self._lock:
+            shared = self._shared.get(id(matrix))
+            if shared is None or not shared._finalizer.alive:
+                shared = SharedMatrix(matrix)
+                self._shared[id(matrix)] = shared
+                weakref.finalize(matrix, self._shared.pop, id(matrix), None)
+            return shared
+
+    @staticmethod
+    def _merge(ranked, top_n):
+        idx = np.concatenate([r[0] for r in ranked])
+        scores = np.concatenate([r[1] for r in ranked])
+        order = np.lexsort((idx, -scores))[:top_n]
+        return idx[order], scores[order]
+
+    def close(self):
+        self._pool.shutdown()
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
+
+SONG_FIELDS = ['id', 'title', 'artist', 'genre', 'year', 'bpm', 'energy', 'danceability', 'duration']
+# Rendered /api/songs pages kept per catalog
+PAGE_CACHE_BYTES = 16 * 1024 * 1024
+
+
+def _int_column(df, col, default):
+    if col not in df.columns:
+        return np.full(len(df), default, dtype=np.int64)
+    values = np.nan_to_num(df[col].to_numpy(dtype=np.float64), nan=default)
+    return values.astype(np.int64)
+
+
+def _str_column(df, col, default):
+    if col not in df.columns:
+        return np.full(len(df), default, dtype=object)
+    return df[col].to_numpy(dtype=object)
+
+
+def format_durations(seconds):
+    # MM:SS for every song at once; durations repeat a lot, so only the
+    # distinct values are formatted
+    seconds = np.nan_to_num(np.asarray(seconds, dtype=np.float64), nan=180)
+    values, inverse = np.unique(seconds, return_inverse=True)
+    labels = np.array([f"{int(v // 60)}:{int(v % 60):02d}" for v in values], dtype=object)
+    return labels[inverse.reshape(-1)]
+
+
+class SongSerializer:
+    # Song columns pulled out of the DataFrame once per dataset load, already
+    # converted to the types the API returns
+    def __init__(self, df):
+        self.columns = {
+            'id': df.index.astype(str).to_numpy(dtype=object),
+            'title': _str_column(df, 'title', None),
+            'artist': _str_column(df, 'artist', 'Unknown Artist'),
+            'genre': _str_column(df, 'genre', 'Unknown Genre'),
+            'year': _int_column(df, 'year', 2020),
+            'bpm': _int_column(df, 'bpm', 120),
+            'energy': _int_column(df, 'energy', 50),
+            'danceability': _int_column(df, 'danceability', 50),
+            'duration': format_durations(df['duration'] if 'duration' in df.columns else np.full(len(df), 180)),
+        }
+        if 'title' not in df.columns:
+            self.columns['title'] = np.array([f"Song {i}" for i in range(len(df))], dtype=object)
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def records(self, idx, fields=None, extra=None):
+        # Response dicts for all rows in idx in one pass over the columns.
+        # extra maps additional keys (score, likes) to per-row values.
+        fields = list(fields or SONG_FIELDS)
+        values = [self.columns[f][idx].tolist() for f in fields]
+        for key, column in (extra or {}).items():
+            fields.append(key)
+            values.append(list(column))
+        return [dict(zip(fields, row)) for row in zip(*values)]
+
+
+def round_scores(scores):
+    return [float(f'{s:.3f}') for s in scores]
+
+
+class SongPageCache:
+    # Pre-rendered JSON bytes per (offset, limit, fields) page, LRU-bounded by
+    # total size. A repeated page request is a dictionary lookup plus a
+    # memcpy. Only pages on a multiple of their own size are kept, so the
+    # entries of one page size never overlap; unpaged (whole catalog) and
+    # offset-shifted requests are rendered each time.
+    def __init__(self, serializer, version, max_bytes=PAGE_CACHE_BYTES):
+        self.serializer = serializer
+        self.version = version
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def etag(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+        return f'"{self.version}-{digest}"'
+
+    def get(self, key, render, cacheable=True):
+        if not cacheable:
+            return render()
+        with self._lock:
+            if key in self._pages:
+                self._pages.move_to_end(key)
+                return self._pages[key]
+        body = render()
+        if len(body) > self.max_bytes:
+            return body
+        with self._lock:
+            if key not in self._pages:
+                self._pages[key] = body
+                self.nbytes += len(body)
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= len(self._pages.popitem(last=False)[1])
+        return body
+
+    def page(self, offset, limit, fields, wrap=True):
+        total = len(self.serializer)
+        end = total if limit is None else min(total, offset + limit)
+        key = ('page', offset, end, tuple(fields), wrap)
+
+        def render():
+            songs = self.serializer.records(np.arange(offset, end), fields)
+            if not wrap:
+                return json.dumps(songs).encode()
+            next_cursor = f'{self.version}:{end}' if end < total else None
+            return json.dumps({'songs': songs, 'next_cursor': next_cursor, 'total': total}).encode()
+        cacheable = bool(limit) and offset % limit == 0
+        return self.get(key, render, cacheable=cacheable), self.etag(key)
+
+    def ndjson_chunks(self, offset, limit, fields, chunk_size=1000):
+        total = len(self.serializer)
+        end = total if limit is None else min(total, offset + limit)
+        for start in range(offset, end, chunk_size):
+            stop = min(start + chunk_size, end)
+            key = ('ndjson', start, stop, tuple(fields))
+
+            def render(start=start, stop=stop):
+                songs = self.serializer.records(np.arange(start, stop), fields)
+                return ''.join(json.dumps(s) + '\n' for s in songs).encode()
+            # Whole aligned chunks only; the ends of a shifted range are not
+            # worth keeping
+            cacheable = start % chunk_size == 0 and stop in (start + chunk_size, total)
+            yield self.get(key, render, cacheable=cacheable)
@@ -23,6 +23,22 @@ export async function retrainModel() {
   return res.json();
 }
 
+export async function getRetrainStatus(jobId) {
+  const res = await fetch(`${API_BASE}/retrain/${jobId}`);
+  return res.json();
+}
+
+// Retraining runs in the background; poll the job until it finishes
+export async function retrainAndWait(intervalMs = 1000) {
+  const { job_id } = await retrainModel();
+  let job = await getRetrainStatus(job_id);
+  while (job.status === 'queued' || job.status === 'running') {
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+    job = await getRetrainStatus(job_id);
+  }
+  return job;
+}
+
 export async function getFeedbackStats() {
   const res = await fetch(`${API_BASE}/admin/feedback-stats`);
   return res.json();
@@ -33,11 +49,22 @@ export async function getSongPopularity() {
   return res.json();
 }
 
+export async function getMetrics() {
+  const res = await fetch(`${API_BASE}/admin/metrics`);
+  return res.json();
+}
+
 export async function getCsvMeta() {
   const res = await fetch(`${API_BASE}/csv-meta`);
   return res.json();
 }
 
+export async function autocomplete(field, q, limit = 10) {
+  const params = new URLSearchParams({ field, q, limit: String(limit) });
+  const res = await fetch(`${API_BASE}/autocomplete?${params}`);
+  return res.json();
+}
+
 export async function uploadCsv(file) {
   const formData = new FormData();
   formData.append('file', file);
@@ -74,4 +101,24 @@ export async function useCsv(type: 'default' | 'user') {
 export async function getCurrentCsv() {
   const res = await fetch('http://localhost:5000/api/current-csv');
   return res.json();
+}
+
+// Uploads are compiled in the background; poll until the job finishes
+export async function waitForIngest(jobId, intervalMs = 500) {
+  let job = await (await fetch(`${API_BASE}/ingest/${jobId}`)).json();
+  while (job.status === 'queued' || job.status === 'running') {
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+    job = await (await fetch(`${API_BASE}/ingest/${jobId}`)).json();
+  }
+  return job;
+}
+
+// Dataset loads happen in the background; wait until the new one is live
+export async function waitForCatalog(intervalMs = 500) {
+  let status = await (await fetch(`${API_BASE}/catalog-status`)).json();
+  while (status.state === 'loading') {
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+    status = await (await fetch(`${API_BASE}/catalog-status`)).json();
+  }
+  return status;
 } 
\ No newline at end of file
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
-import { BarChart3, Users, Music, TrendingUp, RefreshCw } from 'lucide-react';
-import { retrainModel, getFeedbackStats, getSongPopularity } from '../api';
+import { BarChart3, Users, Music, TrendingUp, RefreshCw, Activity } from 'lucide-react';
+import { retrainAndWait, getFeedbackStats, getSongPopularity, getMetrics } from '../api';
 
 async function getUserSessions() {
   const res = await fetch('http://localhost:5000/api/admin/user-sessions');
@@ -12,18 +12,24 @@ export const AdminDashboard: React.FC = () => {
   const [feedbackStats, setFeedbackStats] = useState<{likes: number, dislikes: number, total: number}>({likes: 0, dislikes: 0, total: 0});
   const [songPopularity, setSongPopularity] = useState<{top_songs: [string, number][]}>({top_songs: []});
   const [userSessions, setUserSessions] = useState<any[]>([]);
+  const [metrics, setMetrics] = useState<{histograms: Record<string, any[]>, gauges: Record<string, any>}>({histograms: {}, gauges: {}});
 
   useEffect(() => {
     getFeedbackStats().then(setFeedbackStats);
     getSongPopularity().then(setSongPopularity);
     getUserSessions().then(data => setUserSessions(data.sessions || []));
+    getMetrics().then(setMetrics);
   }, [isRetraining]);
 
+  const formatMs = (ms: number | null) => (ms === null || ms === undefined ? '-' : ms.toFixed(2));
+  const recommendStages = (metrics.histograms.pipeline_stage_seconds || []).filter(row => row.pipeline === 'recommend');
+  const endpointLatency = (metrics.histograms.http_request_seconds || []).filter(row => row.endpoint.startsWith('/api/'));
+
   const handleRetrain = async () => {
     setIsRetraining(true);
-    await retrainModel();
+    const job = await retrainAndWait();
     setIsRetraining(false);
-    alert('Model retrained successfully!');
+    alert(job.status === 'done' ? 'Model retrained successfully!' : 'Retraining failed: ' + (job.error || 'Unknown error'));
   };
 
   return (
@@ -131,6 +137,47 @@ export const AdminDashboard: React.FC = () => {
             </div>
           </div>
 
+          {/* Latency */}
+          <div className="bg-white/10 backdrop-blur-md rounded-xl p-6 border border-white/20">
+            <h2 className="text-xl font-semibold text-white mb-6 flex items-center">
+              <Activity className="h-6 w-6 mr-2 text-blue-400" />
+              Latency (ms)
+            </h2>
+            <div className="space-y-6 max-h-96 overflow-y-auto text-sm">
+              {endpointLatency.length === 0 && <p className="text-white/60">No requests recorded yet.</p>}
+              {[['Recommendation stages', recommendStages, 'stage'], ['Endpoints', endpointLatency, 'endpoint']].map(([title, rows, key]: any) => rows.length > 0 && (
+                <table key={title} className="w-full text-left text-white/80">
+                  <thead>
+                    <tr className="text-white/50">
+                      <th className="font-medium">{title}</th>
+                      <th className="font-medium">Count</th>
+                      <th className="font-medium">p50</th>
+                      <th className="font-medium">p95</th>
+                      <th className="font-medium">p99</th>
+                    </tr>
+                  </thead>
+                  <tbody>
+                    {rows.map((row: any) => (
+                      <tr key={row[key] + (row.method || '') + (row.status || '')}>
+                        <td className="break-all pr-2">{key === 'endpoint' ? `${row.method} ${row.endpoint} ${row.status}` : row.stage}</td>
+                        <td>{row.count}</td>
+                        <td>{formatMs(row.p50_ms)}</td>
+                        <td>{formatMs(row.p95_ms)}</td>
+                        <td>{formatMs(row.p99_ms)}</td>
+                      </tr>
+                    ))}
+                  </tbody>
+                </table>
+              ))}
+              {metrics.gauges.recommend_cache && (
+                <p className="text-white/60">
+                  Result cache: {metrics.gauges.recommend_cache.hits} hits, {metrics.gauges.recommend_cache.misses} misses,
+                  {' '}{(metrics.gauges.recommend_cache.hit_rate * 100).toFixed(1)}% hit rate
+                </p>
+              )}
+            </div>
+          </div>
+
           {/* Model Retraining */}
           
         </div>
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import { getRecommendations, getTrendingSongs, getCsvMeta, uploadCsv, downloadDemoCsv, getSimilarSongs, useCsv, getCurrentCsv } from '../api';
+import { getRecommendations, getTrendingSongs, getCsvMeta, uploadCsv, downloadDemoCsv, getSimilarSongs, useCsv, getCurrentCsv, waitForCatalog, waitForIngest } from '../api';
 
 export const HomeRecommendations: React.FC = () => {
   const [recommendations, setRecommendations] = useState<any[]>([]);
@@ -35,8 +35,19 @@ export const HomeRecommendations: React.FC = () => {
     setCsvUploadStatus('Uploading...');
     const res = await uploadCsv(file);
     if (res.status === 'success') {
-      setCsvUploadStatus('CSV uploaded and processed!');
+      setCsvUploadStatus('Processing CSV...');
+      const job = await waitForIngest(res.job_id);
+      if (job.status === 'failed') {
+        setCsvUploadStatus('Upload failed: ' + (job.error || 'Unknown error'));
+        return;
+      }
       await useCsv('user');
+      const status = await waitForCatalog();
+      if (status.state === 'failed') {
+        setCsvUploadStatus('Upload failed: ' + (status.error || 'Unknown error'));
+        return;
+      }
+      setCsvUploadStatus('CSV uploaded and processed!');
       setCsvType('user');
       await loadAll();
       setTimeout(() => setCsvUploadStatus(''), 3000);
@@ -53,6 +64,7 @@ export const HomeRecommendations: React.FC = () => {
 
   const handleSwitchCsv = async (type: 'default' | 'user') => {
     await useCsv(type);
+    await waitForCatalog();
     setCsvType(type);
     await loadAll();
   };
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Sliders, Search } from 'lucide-react';
-import { getCsvMeta } from '../api';
+import { getCsvMeta, autocomplete } from '../api';
 
 interface FormData {
   [key: string]: string | number;
@@ -14,11 +14,25 @@ export const RecommendationForm: React.FC = () => {
   const [genreInput, setGenreInput] = useState('');
   const [artistInput, setArtistInput] = useState('');
   const [moodInput, setMoodInput] = useState('');
+  const [artistMatches, setArtistMatches] = useState<string[] | null>(null);
 
   useEffect(() => {
     getCsvMeta().then(setCsvMeta);
   }, []);
 
+  // csv-meta only lists the most frequent artists; typing searches them all
+  useEffect(() => {
+    if (!artistInput) {
+      setArtistMatches(null);
+      return;
+    }
+    let cancelled = false;
+    autocomplete('artist', artistInput, 50).then(data => {
+      if (!cancelled) setArtistMatches((data.matches || []).map((m: {value: string}) => m.value));
+    });
+    return () => { cancelled = true; };
+  }, [artistInput]);
+
   const handleSubmit = (e: React.FormEvent) => {
     e.preventDefault();
     localStorage.setItem('musicPreferences', JSON.stringify(formData));
@@ -27,7 +41,7 @@ export const RecommendationForm: React.FC = () => {
 
   // Filtered dropdowns
   const filteredGenres = csvMeta.genres.filter(g => g.toLowerCase().includes(genreInput.toLowerCase()));
-  const filteredArtists = csvMeta.artists.filter(a => a.toLowerCase().includes(artistInput.toLowerCase()));
+  const filteredArtists = artistMatches ?? csvMeta.artists;
   const filteredMoods = csvMeta.moods.filter(m => m.toLowerCase().includes(moodInput.toLowerCase()));
 
   return (